@@ -1,14 +1,310 @@
 #!/usr/bin/env python3
 
+import argparse
+import cProfile
 from enum import Enum
+import functools
+import itertools
+import io
+import json
 import logging
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import pstats
+import queue
 import random
 import re
+import sqlite3
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
 
 log = logging.getLogger(__name__)
 
+# keys hashing a position, Polyglot's Random64 so that Board.key looks up
+# opening books: 12 * 64 for pieces on squares, then castling rights, en
+# passant columns and white to move
+zobrist_keys = [
+    0x9D39247E33776D41, 0x2AF7398005AAA5C7, 0x44DB015024623547,
+    0x9C15F73E62A76AE2, 0x75834465489C0C89, 0x3290AC3A203001BF,
+    0x0FBBAD1F61042279, 0xE83A908FF2FB60CA, 0x0D7E765D58755C10,
+    0x1A083822CEAFE02D, 0x9605D5F0E25EC3B0, 0xD021FF5CD13A2ED5,
+    0x40BDF15D4A672E32, 0x011355146FD56395, 0x5DB4832046F3D9E5,
+    0x239F8B2D7FF719CC, 0x05D1A1AE85B49AA1, 0x679F848F6E8FC971,
+    0x7449BBFF801FED0B, 0x7D11CDB1C3B7ADF0, 0x82C7709E781EB7CC,
+    0xF3218F1C9510786C, 0x331478F3AF51BBE6, 0x4BB38DE5E7219443,
+    0xAA649C6EBCFD50FC, 0x8DBD98A352AFD40B, 0x87D2074B81D79217,
+    0x19F3C751D3E92AE1, 0xB4AB30F062B19ABF, 0x7B0500AC42047AC4,
+    0xC9452CA81A09D85D, 0x24AA6C514DA27500, 0x4C9F34427501B447,
+    0x14A68FD73C910841, 0xA71B9B83461CBD93, 0x03488B95B0F1850F,
+    0x637B2B34FF93C040, 0x09D1BC9A3DD90A94, 0x3575668334A1DD3B,
+    0x735E2B97A4C45A23, 0x18727070F1BD400B, 0x1FCBACD259BF02E7,
+    0xD310A7C2CE9B6555, 0xBF983FE0FE5D8244, 0x9F74D14F7454A824,
+    0x51EBDC4AB9BA3035, 0x5C82C505DB9AB0FA, 0xFCF7FE8A3430B241,
+    0x3253A729B9BA3DDE, 0x8C74C368081B3075, 0xB9BC6C87167C33E7,
+    0x7EF48F2B83024E20, 0x11D505D4C351BD7F, 0x6568FCA92C76A243,
+    0x4DE0B0F40F32A7B8, 0x96D693460CC37E5D, 0x42E240CB63689F2F,
+    0x6D2BDCDAE2919661, 0x42880B0236E4D951, 0x5F0F4A5898171BB6,
+    0x39F890F579F92F88, 0x93C5B5F47356388B, 0x63DC359D8D231B78,
+    0xEC16CA8AEA98AD76, 0x5355F900C2A82DC7, 0x07FB9F855A997142,
+    0x5093417AA8A7ED5E, 0x7BCBC38DA25A7F3C, 0x19FC8A768CF4B6D4,
+    0x637A7780DECFC0D9, 0x8249A47AEE0E41F7, 0x79AD695501E7D1E8,
+    0x14ACBAF4777D5776, 0xF145B6BECCDEA195, 0xDABF2AC8201752FC,
+    0x24C3C94DF9C8D3F6, 0xBB6E2924F03912EA, 0x0CE26C0B95C980D9,
+    0xA49CD132BFBF7CC4, 0xE99D662AF4243939, 0x27E6AD7891165C3F,
+    0x8535F040B9744FF1, 0x54B3F4FA5F40D873, 0x72B12C32127FED2B,
+    0xEE954D3C7B411F47, 0x9A85AC909A24EAA1, 0x70AC4CD9F04F21F5,
+    0xF9B89D3E99A075C2, 0x87B3E2B2B5C907B1, 0xA366E5B8C54F48B8,
+    0xAE4A9346CC3F7CF2, 0x1920C04D47267BBD, 0x87BF02C6B49E2AE9,
+    0x092237AC237F3859, 0xFF07F64EF8ED14D0, 0x8DE8DCA9F03CC54E,
+    0x9C1633264DB49C89, 0xB3F22C3D0B0B38ED, 0x390E5FB44D01144B,
+    0x5BFEA5B4712768E9, 0x1E1032911FA78984, 0x9A74ACB964E78CB3,
+    0x4F80F7A035DAFB04, 0x6304D09A0B3738C4, 0x2171E64683023A08,
+    0x5B9B63EB9CEFF80C, 0x506AACF489889342, 0x1881AFC9A3A701D6,
+    0x6503080440750644, 0xDFD395339CDBF4A7, 0xEF927DBCF00C20F2,
+    0x7B32F7D1E03680EC, 0xB9FD7620E7316243, 0x05A7E8A57DB91B77,
+    0xB5889C6E15630A75, 0x4A750A09CE9573F7, 0xCF464CEC899A2F8A,
+    0xF538639CE705B824, 0x3C79A0FF5580EF7F, 0xEDE6C87F8477609D,
+    0x799E81F05BC93F31, 0x86536B8CF3428A8C, 0x97D7374C60087B73,
+    0xA246637CFF328532, 0x043FCAE60CC0EBA0, 0x920E449535DD359E,
+    0x70EB093B15B290CC, 0x73A1921916591CBD, 0x56436C9FE1A1AA8D,
+    0xEFAC4B70633B8F81, 0xBB215798D45DF7AF, 0x45F20042F24F1768,
+    0x930F80F4E8EB7462, 0xFF6712FFCFD75EA1, 0xAE623FD67468AA70,
+    0xDD2C5BC84BC8D8FC, 0x7EED120D54CF2DD9, 0x22FE545401165F1C,
+    0xC91800E98FB99929, 0x808BD68E6AC10365, 0xDEC468145B7605F6,
+    0x1BEDE3A3AEF53302, 0x43539603D6C55602, 0xAA969B5C691CCB7A,
+    0xA87832D392EFEE56, 0x65942C7B3C7E11AE, 0xDED2D633CAD004F6,
+    0x21F08570F420E565, 0xB415938D7DA94E3C, 0x91B859E59ECB6350,
+    0x10CFF333E0ED804A, 0x28AED140BE0BB7DD, 0xC5CC1D89724FA456,
+    0x5648F680F11A2741, 0x2D255069F0B7DAB3, 0x9BC5A38EF729ABD4,
+    0xEF2F054308F6A2BC, 0xAF2042F5CC5C2858, 0x480412BAB7F5BE2A,
+    0xAEF3AF4A563DFE43, 0x19AFE59AE451497F, 0x52593803DFF1E840,
+    0xF4F076E65F2CE6F0, 0x11379625747D5AF3, 0xBCE5D2248682C115,
+    0x9DA4243DE836994F, 0x066F70B33FE09017, 0x4DC4DE189B671A1C,
+    0x51039AB7712457C3, 0xC07A3F80C31FB4B4, 0xB46EE9C5E64A6E7C,
+    0xB3819A42ABE61C87, 0x21A007933A522A20, 0x2DF16F761598AA4F,
+    0x763C4A1371B368FD, 0xF793C46702E086A0, 0xD7288E012AEB8D31,
+    0xDE336A2A4BC1C44B, 0x0BF692B38D079F23, 0x2C604A7A177326B3,
+    0x4850E73E03EB6064, 0xCFC447F1E53C8E1B, 0xB05CA3F564268D99,
+    0x9AE182C8BC9474E8, 0xA4FC4BD4FC5558CA, 0xE755178D58FC4E76,
+    0x69B97DB1A4C03DFE, 0xF9B5B7C4ACC67C96, 0xFC6A82D64B8655FB,
+    0x9C684CB6C4D24417, 0x8EC97D2917456ED0, 0x6703DF9D2924E97E,
+    0xC547F57E42A7444E, 0x78E37644E7CAD29E, 0xFE9A44E9362F05FA,
+    0x08BD35CC38336615, 0x9315E5EB3A129ACE, 0x94061B871E04DF75,
+    0xDF1D9F9D784BA010, 0x3BBA57B68871B59D, 0xD2B7ADEEDED1F73F,
+    0xF7A255D83BC373F8, 0xD7F4F2448C0CEB81, 0xD95BE88CD210FFA7,
+    0x336F52F8FF4728E7, 0xA74049DAC312AC71, 0xA2F61BB6E437FDB5,
+    0x4F2A5CB07F6A35B3, 0x87D380BDA5BF7859, 0x16B9F7E06C453A21,
+    0x7BA2484C8A0FD54E, 0xF3A678CAD9A2E38C, 0x39B0BF7DDE437BA2,
+    0xFCAF55C1BF8A4424, 0x18FCF680573FA594, 0x4C0563B89F495AC3,
+    0x40E087931A00930D, 0x8CFFA9412EB642C1, 0x68CA39053261169F,
+    0x7A1EE967D27579E2, 0x9D1D60E5076F5B6F, 0x3810E399B6F65BA2,
+    0x32095B6D4AB5F9B1, 0x35CAB62109DD038A, 0xA90B24499FCFAFB1,
+    0x77A225A07CC2C6BD, 0x513E5E634C70E331, 0x4361C0CA3F692F12,
+    0xD941ACA44B20A45B, 0x528F7C8602C5807B, 0x52AB92BEB9613989,
+    0x9D1DFA2EFC557F73, 0x722FF175F572C348, 0x1D1260A51107FE97,
+    0x7A249A57EC0C9BA2, 0x04208FE9E8F7F2D6, 0x5A110C6058B920A0,
+    0x0CD9A497658A5698, 0x56FD23C8F9715A4C, 0x284C847B9D887AAE,
+    0x04FEABFBBDB619CB, 0x742E1E651C60BA83, 0x9A9632E65904AD3C,
+    0x881B82A13B51B9E2, 0x506E6744CD974924, 0xB0183DB56FFC6A79,
+    0x0ED9B915C66ED37E, 0x5E11E86D5873D484, 0xF678647E3519AC6E,
+    0x1B85D488D0F20CC5, 0xDAB9FE6525D89021, 0x0D151D86ADB73615,
+    0xA865A54EDCC0F019, 0x93C42566AEF98FFB, 0x99E7AFEABE000731,
+    0x48CBFF086DDF285A, 0x7F9B6AF1EBF78BAF, 0x58627E1A149BBA21,
+    0x2CD16E2ABD791E33, 0xD363EFF5F0977996, 0x0CE2A38C344A6EED,
+    0x1A804AADB9CFA741, 0x907F30421D78C5DE, 0x501F65EDB3034D07,
+    0x37624AE5A48FA6E9, 0x957BAF61700CFF4E, 0x3A6C27934E31188A,
+    0xD49503536ABCA345, 0x088E049589C432E0, 0xF943AEE7FEBF21B8,
+    0x6C3B8E3E336139D3, 0x364F6FFA464EE52E, 0xD60F6DCEDC314222,
+    0x56963B0DCA418FC0, 0x16F50EDF91E513AF, 0xEF1955914B609F93,
+    0x565601C0364E3228, 0xECB53939887E8175, 0xBAC7A9A18531294B,
+    0xB344C470397BBA52, 0x65D34954DAF3CEBD, 0xB4B81B3FA97511E2,
+    0xB422061193D6F6A7, 0x071582401C38434D, 0x7A13F18BBEDC4FF5,
+    0xBC4097B116C524D2, 0x59B97885E2F2EA28, 0x99170A5DC3115544,
+    0x6F423357E7C6A9F9, 0x325928EE6E6F8794, 0xD0E4366228B03343,
+    0x565C31F7DE89EA27, 0x30F5611484119414, 0xD873DB391292ED4F,
+    0x7BD94E1D8E17DEBC, 0xC7D9F16864A76E94, 0x947AE053EE56E63C,
+    0xC8C93882F9475F5F, 0x3A9BF55BA91F81CA, 0xD9A11FBB3D9808E4,
+    0x0FD22063EDC29FCA, 0xB3F256D8ACA0B0B9, 0xB03031A8B4516E84,
+    0x35DD37D5871448AF, 0xE9F6082B05542E4E, 0xEBFAFA33D7254B59,
+    0x9255ABB50D532280, 0xB9AB4CE57F2D34F3, 0x693501D628297551,
+    0xC62C58F97DD949BF, 0xCD454F8F19C5126A, 0xBBE83F4ECC2BDECB,
+    0xDC842B7E2819E230, 0xBA89142E007503B8, 0xA3BC941D0A5061CB,
+    0xE9F6760E32CD8021, 0x09C7E552BC76492F, 0x852F54934DA55CC9,
+    0x8107FCCF064FCF56, 0x098954D51FFF6580, 0x23B70EDB1955C4BF,
+    0xC330DE426430F69D, 0x4715ED43E8A45C0A, 0xA8D7E4DAB780A08D,
+    0x0572B974F03CE0BB, 0xB57D2E985E1419C7, 0xE8D9ECBE2CF3D73F,
+    0x2FE4B17170E59750, 0x11317BA87905E790, 0x7FBF21EC8A1F45EC,
+    0x1725CABFCB045B00, 0x964E915CD5E2B207, 0x3E2B8BCBF016D66D,
+    0xBE7444E39328A0AC, 0xF85B2B4FBCDE44B7, 0x49353FEA39BA63B1,
+    0x1DD01AAFCD53486A, 0x1FCA8A92FD719F85, 0xFC7C95D827357AFA,
+    0x18A6A990C8B35EBD, 0xCCCB7005C6B9C28D, 0x3BDBB92C43B17F26,
+    0xAA70B5B4F89695A2, 0xE94C39A54A98307F, 0xB7A0B174CFF6F36E,
+    0xD4DBA84729AF48AD, 0x2E18BC1AD9704A68, 0x2DE0966DAF2F8B1C,
+    0xB9C11D5B1E43A07E, 0x64972D68DEE33360, 0x94628D38D0C20584,
+    0xDBC0D2B6AB90A559, 0xD2733C4335C6A72F, 0x7E75D99D94A70F4D,
+    0x6CED1983376FA72B, 0x97FCAACBF030BC24, 0x7B77497B32503B12,
+    0x8547EDDFB81CCB94, 0x79999CDFF70902CB, 0xCFFE1939438E9B24,
+    0x829626E3892D95D7, 0x92FAE24291F2B3F1, 0x63E22C147B9C3403,
+    0xC678B6D860284A1C, 0x5873888850659AE7, 0x0981DCD296A8736D,
+    0x9F65789A6509A440, 0x9FF38FED72E9052F, 0xE479EE5B9930578C,
+    0xE7F28ECD2D49EECD, 0x56C074A581EA17FE, 0x5544F7D774B14AEF,
+    0x7B3F0195FC6F290F, 0x12153635B2C0CF57, 0x7F5126DBBA5E0CA7,
+    0x7A76956C3EAFB413, 0x3D5774A11D31AB39, 0x8A1B083821F40CB4,
+    0x7B4A38E32537DF62, 0x950113646D1D6E03, 0x4DA8979A0041E8A9,
+    0x3BC36E078F7515D7, 0x5D0A12F27AD310D1, 0x7F9D1A2E1EBE1327,
+    0xDA3A361B1C5157B1, 0xDCDD7D20903D0C25, 0x36833336D068F707,
+    0xCE68341F79893389, 0xAB9090168DD05F34, 0x43954B3252DC25E5,
+    0xB438C2B67F98E5E9, 0x10DCD78E3851A492, 0xDBC27AB5447822BF,
+    0x9B3CDB65F82CA382, 0xB67B7896167B4C84, 0xBFCED1B0048EAC50,
+    0xA9119B60369FFEBD, 0x1FFF7AC80904BF45, 0xAC12FB171817EEE7,
+    0xAF08DA9177DDA93D, 0x1B0CAB936E65C744, 0xB559EB1D04E5E932,
+    0xC37B45B3F8D6F2BA, 0xC3A9DC228CAAC9E9, 0xF3B8B6675A6507FF,
+    0x9FC477DE4ED681DA, 0x67378D8ECCEF96CB, 0x6DD856D94D259236,
+    0xA319CE15B0B4DB31, 0x073973751F12DD5E, 0x8A8E849EB32781A5,
+    0xE1925C71285279F5, 0x74C04BF1790C0EFE, 0x4DDA48153C94938A,
+    0x9D266D6A1CC0542C, 0x7440FB816508C4FE, 0x13328503DF48229F,
+    0xD6BF7BAEE43CAC40, 0x4838D65F6EF6748F, 0x1E152328F3318DEA,
+    0x8F8419A348F296BF, 0x72C8834A5957B511, 0xD7A023A73260B45C,
+    0x94EBC8ABCFB56DAE, 0x9FC10D0F989993E0, 0xDE68A2355B93CAE6,
+    0xA44CFE79AE538BBE, 0x9D1D84FCCE371425, 0x51D2B1AB2DDFB636,
+    0x2FD7E4B9E72CD38C, 0x65CA5B96B7552210, 0xDD69A0D8AB3B546D,
+    0x604D51B25FBF70E2, 0x73AA8A564FB7AC9E, 0x1A8C1E992B941148,
+    0xAAC40A2703D9BEA0, 0x764DBEAE7FA4F3A6, 0x1E99B96E70A9BE8B,
+    0x2C5E9DEB57EF4743, 0x3A938FEE32D29981, 0x26E6DB8FFDF5ADFE,
+    0x469356C504EC9F9D, 0xC8763C5B08D1908C, 0x3F6C6AF859D80055,
+    0x7F7CC39420A3A545, 0x9BFB227EBDF4C5CE, 0x89039D79D6FC5C5C,
+    0x8FE88B57305E2AB6, 0xA09E8C8C35AB96DE, 0xFA7E393983325753,
+    0xD6B6D0ECC617C699, 0xDFEA21EA9E7557E3, 0xB67C1FA481680AF8,
+    0xCA1E3785A9E724E5, 0x1CFC8BED0D681639, 0xD18D8549D140CAEA,
+    0x4ED0FE7E9DC91335, 0xE4DBF0634473F5D2, 0x1761F93A44D5AEFE,
+    0x53898E4C3910DA55, 0x734DE8181F6EC39A, 0x2680B122BAA28D97,
+    0x298AF231C85BAFAB, 0x7983EED3740847D5, 0x66C1A2A1A60CD889,
+    0x9E17E49642A3E4C1, 0xEDB454E7BADC0805, 0x50B704CAB602C329,
+    0x4CC317FB9CDDD023, 0x66B4835D9EAFEA22, 0x219B97E26FFC81BD,
+    0x261E4E4C0A333A9D, 0x1FE2CCA76517DB90, 0xD7504DFA8816EDBB,
+    0xB9571FA04DC089C8, 0x1DDC0325259B27DE, 0xCF3F4688801EB9AA,
+    0xF4F5D05C10CAB243, 0x38B6525C21A42B0E, 0x36F60E2BA4FA6800,
+    0xEB3593803173E0CE, 0x9C4CD6257C5A3603, 0xAF0C317D32ADAA8A,
+    0x258E5A80C7204C4B, 0x8B889D624D44885D, 0xF4D14597E660F855,
+    0xD4347F66EC8941C3, 0xE699ED85B0DFB40D, 0x2472F6207C2D0484,
+    0xC2A1E7B5B459AEB5, 0xAB4F6451CC1D45EC, 0x63767572AE3D6174,
+    0xA59E0BD101731A28, 0x116D0016CB948F09, 0x2CF9C8CA052F6E9F,
+    0x0B090A7560A968E3, 0xABEEDDB2DDE06FF1, 0x58EFC10B06A2068D,
+    0xC6E57A78FBD986E0, 0x2EAB8CA63CE802D7, 0x14A195640116F336,
+    0x7C0828DD624EC390, 0xD74BBE77E6116AC7, 0x804456AF10F5FB53,
+    0xEBE9EA2ADF4321C7, 0x03219A39EE587A30, 0x49787FEF17AF9924,
+    0xA1E9300CD8520548, 0x5B45E522E4B1B4EF, 0xB49C3B3995091A36,
+    0xD4490AD526F14431, 0x12A8F216AF9418C2, 0x001F837CC7350524,
+    0x1877B51E57A764D5, 0xA2853B80F17F58EE, 0x993E1DE72D36D310,
+    0xB3598080CE64A656, 0x252F59CF0D9F04BB, 0xD23C8E176D113600,
+    0x1BDA0492E7E4586E, 0x21E0BD5026C619BF, 0x3B097ADAF088F94E,
+    0x8D14DEDB30BE846E, 0xF95CFFA23AF5F6F4, 0x3871700761B3F743,
+    0xCA672B91E9E4FA16, 0x64C8E531BFF53B55, 0x241260ED4AD1E87D,
+    0x106C09B972D2E822, 0x7FBA195410E5CA30, 0x7884D9BC6CB569D8,
+    0x0647DFEDCD894A29, 0x63573FF03E224774, 0x4FC8E9560F91B123,
+    0x1DB956E450275779, 0xB8D91274B9E9D4FB, 0xA2EBEE47E2FBFCE1,
+    0xD9F1F30CCD97FB09, 0xEFED53D75FD64E6B, 0x2E6D02C36017F67F,
+    0xA9AA4D20DB084E9B, 0xB64BE8D8B25396C1, 0x70CB6AF7C2D5BCF0,
+    0x98F076A4F7A2322E, 0xBF84470805E69B5F, 0x94C3251F06F90CF3,
+    0x3E003E616A6591E9, 0xB925A6CD0421AFF3, 0x61BDD1307C66E300,
+    0xBF8D5108E27E0D48, 0x240AB57A8B888B20, 0xFC87614BAF287E07,
+    0xEF02CDD06FFDB432, 0xA1082C0466DF6C0A, 0x8215E577001332C8,
+    0xD39BB9C3A48DB6CF, 0x2738259634305C14, 0x61CF4F94C97DF93D,
+    0x1B6BACA2AE4E125B, 0x758F450C88572E0B, 0x959F587D507A8359,
+    0xB063E962E045F54D, 0x60E8ED72C0DFF5D1, 0x7B64978555326F9F,
+    0xFD080D236DA814BA, 0x8C90FD9B083F4558, 0x106F72FE81E2C590,
+    0x7976033A39F7D952, 0xA4EC0132764CA04B, 0x733EA705FAE4FA77,
+    0xB4D8F77BC3E56167, 0x9E21F4F903B33FD9, 0x9D765E419FB69F6D,
+    0xD30C088BA61EA5EF, 0x5D94337FBFAF7F5B, 0x1A4E4822EB4D7A59,
+    0x6FFE73E81B637FB3, 0xDDF957BC36D8B9CA, 0x64D0E29EEA8838B3,
+    0x08DD9BDFD96B9F63, 0x087E79E5A57D1D13, 0xE328E230E3E2B3FB,
+    0x1C2559E30F0946BE, 0x720BF5F26F4D2EAA, 0xB0774D261CC609DB,
+    0x443F64EC5A371195, 0x4112CF68649A260E, 0xD813F2FAB7F5C5CA,
+    0x660D3257380841EE, 0x59AC2C7873F910A3, 0xE846963877671A17,
+    0x93B633ABFA3469F8, 0xC0C0F5A60EF4CDCF, 0xCAF21ECD4377B28C,
+    0x57277707199B8175, 0x506C11B9D90E8B1D, 0xD83CC2687A19255F,
+    0x4A29C6465A314CD1, 0xED2DF21216235097, 0xB5635C95FF7296E2,
+    0x22AF003AB672E811, 0x52E762596BF68235, 0x9AEBA33AC6ECC6B0,
+    0x944F6DE09134DFB6, 0x6C47BEC883A7DE39, 0x6AD047C430A12104,
+    0xA5B1CFDBA0AB4067, 0x7C45D833AFF07862, 0x5092EF950A16DA0B,
+    0x9338E69C052B8E7B, 0x455A4B4CFE30E3F5, 0x6B02E63195AD0CF8,
+    0x6B17B224BAD6BF27, 0xD1E0CCD25BB9C169, 0xDE0C89A556B9AE70,
+    0x50065E535A213CF6, 0x9C1169FA2777B874, 0x78EDEFD694AF1EED,
+    0x6DC93D9526A50E68, 0xEE97F453F06791ED, 0x32AB0EDB696703D3,
+    0x3A6853C7E70757A7, 0x31865CED6120F37D, 0x67FEF95D92607890,
+    0x1F2B1D1F15F6DC9C, 0xB69E38A8965C6B65, 0xAA9119FF184CCCF4,
+    0xF43C732873F24C13, 0xFB4A3D794A9A80D2, 0x3550C2321FD6109C,
+    0x371F77E76BB8417E, 0x6BFA9AAE5EC05779, 0xCD04F3FF001A4778,
+    0xE3273522064480CA, 0x9F91508BFFCFC14A, 0x049A7F41061A9E60,
+    0xFCB6BE43A9F2FE9B, 0x08DE8A1C7797DA9B, 0x8F9887E6078735A1,
+    0xB5B4071DBFC73A66, 0x230E343DFBA08D33, 0x43ED7F5A0FAE657D,
+    0x3A88A0FBBCB05C63, 0x21874B8B4D2DBC4F, 0x1BDEA12E35F6A8C9,
+    0x53C065C6C8E63528, 0xE34A1D250E7A8D6B, 0xD6B04D3B7651DD7E,
+    0x5E90277E7CB39E2D, 0x2C046F22062DC67D, 0xB10BB459132D0A26,
+    0x3FA9DDFB67E2F199, 0x0E09B88E1914F7AF, 0x10E8B35AF3EEAB37,
+    0x9EEDECA8E272B933, 0xD4C718BC4AE8AE5F, 0x81536D601170FC20,
+    0x91B534F885818A06, 0xEC8177F83F900978, 0x190E714FADA5156E,
+    0xB592BF39B0364963, 0x89C350C893AE7DC1, 0xAC042E70F8B383F2,
+    0xB49B52E587A1EE60, 0xFB152FE3FF26DA89, 0x3E666E6F69AE2C15,
+    0x3B544EBE544C19F9, 0xE805A1E290CF2456, 0x24B33C9D7ED25117,
+    0xE74733427B72F0C1, 0x0A804D18B7097475, 0x57E3306D881EDB4F,
+    0x4AE7D6A36EB5DBCB, 0x2D8D5432157064C8, 0xD1E649DE1E7F268B,
+    0x8A328A1CEDFE552C, 0x07A3AEC79624C7DA, 0x84547DDC3E203C94,
+    0x990A98FD5071D263, 0x1A4FF12616EEFC89, 0xF6F7FD1431714200,
+    0x30C05B1BA332F41C, 0x8D2636B81555A786, 0x46C9FEB55D120902,
+    0xCCEC0A73B49C9921, 0x4E9D2827355FC492, 0x19EBB029435DCB0F,
+    0x4659D2B743848A2C, 0x963EF2C96B33BE31, 0x74F85198B05A2E7D,
+    0x5A0F544DD2B1FB18, 0x03727073C2E134B1, 0xC7F6AA2DE59AEA61,
+    0x352787BAA0D7C22F, 0x9853EAB63B5E0B35, 0xABBDCDD7ED5C0860,
+    0xCF05DAF5AC8D77B0, 0x49CAD48CEBF4A71E, 0x7A4C10EC2158C4A6,
+    0xD9E92AA246BF719E, 0x13AE978D09FE5557, 0x730499AF921549FF,
+    0x4E4B705B92903BA4, 0xFF577222C14F0A3A, 0x55B6344CF97AAFAE,
+    0xB862225B055B6960, 0xCAC09AFBDDD2CDB4, 0xDAF8E9829FE96B5F,
+    0xB5FDFC5D3132C498, 0x310CB380DB6F7503, 0xE87FBB46217A360E,
+    0x2102AE466EBB1148, 0xF8549E1A3AA5E00D, 0x07A69AFDCC42261A,
+    0xC4C118BFE78FEAAE, 0xF9F4892ED96BD438, 0x1AF3DBE25D8F45DA,
+    0xF5B4B0B0D2DEEEB4, 0x962ACEEFA82E1C84, 0x046E3ECAAF453CE9,
+    0xF05D129681949A4C, 0x964781CE734B3C84, 0x9C2ED44081CE5FBD,
+    0x522E23F3925E319E, 0x177E00F9FC32F791, 0x2BC60A63A6F3B3F2,
+    0x222BBFAE61725606, 0x486289DDCC3D6780, 0x7DC7785B8EFDFC80,
+    0x8AF38731C02BA980, 0x1FAB64EA29A2DDF7, 0xE4D9429322CD065A,
+    0x9DA058C67844F20C, 0x24C0E332B70019B0, 0x233003B5A6CFE6AD,
+    0xD586BD01C5C217F6, 0x5E5637885F29BC2B, 0x7EBA726D8C94094B,
+    0x0A56A5F0BFE39272, 0xD79476A84EE20D06, 0x9E4C1269BAA4BF37,
+    0x17EFEE45B0DEE640, 0x1D95B0A5FCF90BC6, 0x93CBE0B699C2585D,
+    0x65FA4F227A2B6D79, 0xD5F9E858292504D5, 0xC2B5A03F71471A6F,
+    0x59300222B4561E00, 0xCE2F8642CA0712DC, 0x7CA9723FBB2E8988,
+    0x2785338347F2BA08, 0xC61BB3A141E50E8C, 0x150F361DAB9DEC26,
+    0x9F6A419D382595F4, 0x64A53DC924FE7AC9, 0x142DE49FFF7A7C3D,
+    0x0C335248857FA9E7, 0x0A9C32D5EAE45305, 0xE6C42178C4BBB92E,
+    0x71F1CE2490D20B07, 0xF1BCC3D275AFE51A, 0xE728E8C83C334074,
+    0x96FBF83A12884624, 0x81A1549FD6573DA5, 0x5FA7867CAF35E149,
+    0x56986E2EF3ED091B, 0x917F1DD5F8886C61, 0xD20D8C88C8FFE65F,
+    0x31D71DCE64B2C310, 0xF165B587DF898190, 0xA57E6339DD2CF3A0,
+    0x1EF6E6DBB1961EC9, 0x70CC73D90BC26E24, 0xE21A6B35DF0C3AD7,
+    0x003A93D8B2806962, 0x1C99DED33CB890A1, 0xCF3145DE0ADD4289,
+    0xD0E4427A5514FB72, 0x77C621CC9FB3A483, 0x67A34DAC4356550B,
+    0xF8D626AAAF278509,
+]
+zobrist_castling = {'K': 768, 'Q': 769, 'k': 770, 'q': 771}
+zobrist_en_passant = 772 - 1  # + column
+zobrist_white = 780
+
 
 class Position:
+    __slots__ = ('column', 'row', 'index')
+
     def __init__(self, *args):
         """
         Can be initialized as both 'e2' or 5, 2.
@@ -22,6 +318,8 @@ class Position:
             row = args[1]
         self.column = column
         self.row = row
+        # square index into Board.squares, a1 = 0, b1 = 1, ..., h8 = 63
+        self.index = (row - 1) * 8 + column - 1
 
     def __add__(self, other):
         return Position(self.column + other.column, self.row + other.row)
@@ -58,6 +356,8 @@ class Direction:
     Relative position diff, e.g. +2 columns, -1 row.
     """
 
+    __slots__ = ('column', 'row')
+
     def __init__(self, column, row):
         self.column = column
         self.row = row
@@ -92,117 +392,152 @@ class Direction:
 
 class Move:
     """
-    Particular move, e.g. e2e4.
+    Particular move, e.g. e2e4, a view of the position it is played in.
+
+    A move is stored as its packed 16 bit form (see pack_move), which it
+    compares and hashes by, along with the pieces moving and captured,
+    which are needed to take it back. The squares, the promotion piece and
+    whether it castles or captures en passant are decoded from the packed
+    form when asked for.
     """
 
+    __slots__ = ('packed', 'piece', 'captured')
+
     pgn_re = re.compile(r'^'
-        '('
-            '(?P<piece>[KQRBNP])?'
-            '(?P<old_pos_col>[a-h])?'
-            '(?P<old_pos_row>[1-8])?'
-            '(?P<capture>x)?'
-            '(?P<new_pos_col>[a-h])'
-            '(?P<new_pos_row>[1-8])'
-            '(=(?P<promotion>[QRBN]))?'
-        '|'
-            '(?P<castling>(O-O-O|O-O))'
-        ')'
-        '(?P<check>\+)?'
-        '(?P<checkmate>#)?'
-        '$'
+        r'('
+            r'(?P<piece>[KQRBNP])?'
+            r'(?P<old_pos_col>[a-h])?'
+            r'(?P<old_pos_row>[1-8])?'
+            r'(?P<capture>x)?'
+            r'(?P<new_pos_col>[a-h])'
+            r'(?P<new_pos_row>[1-8])'
+            r'(=(?P<promotion>[QRBN]))?'
+        r'|'
+            r'(?P<castling>(O-O-O|O-O))'
+        r')'
+        r'(?P<check>\+)?'
+        r'(?P<checkmate>#)?'
+        r'$'
     )
 
     def __init__(self, piece=None, new_pos=None, board=None, notation=None,
-                 pgn=None):
+                 pgn=None, promotion=None):
         """
         Can be initialized with:
-          - piece & new_pos
+          - piece & new_pos (& promotion, a piece class)
           - board & notation
           - board & pgn
         """
-        self.promotion = None
         if piece and new_pos:
-            self.piece = piece
-            self.board = piece.board
-            self.old_pos = piece.pos
-            self.new_pos = new_pos
+            board = piece.board
+            old_pos = piece.pos
 
             # automatic promotion
-            # FIXME does it belong here?
-            if isinstance(self.piece, Pawn) and self.new_pos.row in [1, 8]:
-                self.promotion = {
-                    'from': self.piece,
-                    'to': Queen(self.piece.player, self.board,
-                                self.old_pos.column, self.old_pos.row),
-                }
+            if piece.__class__ is Pawn and new_pos.row in [1, 8] \
+                    and not promotion:
+                promotion = Queen
 
         elif board and notation:
-            self.board = board
-            self.old_pos = Position(notation[:2])
-            self.new_pos = Position(notation[2:])
-            self.piece = self.board[self.old_pos]
-
-            if len(notation) > 4:  # TODO type of promotion
-                self.promotion = {
-                    'from': self.piece,
-                    'to': Queen(self.piece.player, self.board,
-                                self.old_pos.column, self.old_pos.row),
-                }
+            old_pos = Position(notation[:2])
+            new_pos = Position(notation[2:4])
+            piece = board[old_pos]
+
+            if len(notation) > 4:
+                promotion = promotion_pieces[notation[4]]
         elif board and pgn:
-            self.board = board
-
-            m = self.pgn_re.match(pgn).groupdict()
-            # TODO castling
-
-            self.new_pos = Position(m['new_pos_col'] + m['new_pos_row'])
-
-            pieces = self.board.active.pieces
-            pieces = filter(lambda p: m['piece'] in p.pgn_signs, pieces)
-            if m['old_pos_col']:
-                pieces = filter(lambda p: p.pos.is_column(m['old_pos_col']),
-                                pieces)
-            if m['old_pos_row']:
-                pieces = filter(lambda p: p.pos.is_row(m['old_pos_row']),
-                                pieces)
-            pieces = filter(lambda p: Move(p, self.new_pos) \
-                                      in p.possible_moves(),
-                            pieces)
-
-            pieces = list(pieces)
-            assert len(pieces) == 1
-            self.piece = pieces[0]
-            self.old_pos = self.piece.pos
-
-            # TODO promotion
+            m = self.pgn_re.match(pgn)
+            if not m:
+                raise ValueError('invalid move %s' % pgn)
+            m = m.groupdict()
+
+            if m['castling']:
+                piece = board.active.king
+                old_pos = piece.pos
+                column = 7 if m['castling'] == 'O-O' else 3
+                new_pos = Position(column, old_pos.row)
+            else:
+                new_pos = Position(m['new_pos_col'] + m['new_pos_row'])
+                if m['promotion']:
+                    promotion = promotion_pieces[m['promotion'].lower()]
+
+                pieces = board.active.pieces
+                pieces = filter(lambda p: m['piece'] in p.pgn_signs, pieces)
+                if m['old_pos_col']:
+                    pieces = filter(
+                        lambda p: p.pos.is_column(m['old_pos_col']), pieces)
+                if m['old_pos_row']:
+                    pieces = filter(lambda p: p.pos.is_row(m['old_pos_row']),
+                                    pieces)
+                pieces = [p for p in pieces
+                          if any(move.new_pos == new_pos
+                                 for move in p.possible_moves())]
+                if len(pieces) > 1:
+                    # SAN leaves out what a pinned piece could not do
+                    pieces = [p for p in pieces if board.is_legal(
+                        Move(p, new_pos, promotion=promotion))]
+
+                if len(pieces) != 1:
+                    raise ValueError('illegal or ambiguous move %s' % pgn)
+                piece = pieces[0]
+                old_pos = piece.pos
         else:
             raise ValueError
 
-        self.player = self.piece.player
-        self.captured = self.board[self.new_pos]
+        old, new = old_pos.index, new_pos.index
+        # as pack_move does, inlined as every generated move needs it
+        self.packed = new | old << 6
+        if promotion:
+            self.packed |= packed_promotions.index(promotion) << 12
+        self.piece = piece
+        self.captured = board.squares[new]
+        # a pawn moving diagonally onto an empty square captures en passant
+        if not self.captured and piece.__class__ is Pawn and (new - old) % 8:
+            self.captured = board.squares[old - old % 8 + new % 8]
 
-    def evaluate(self):
-        score = 0
-        captured = self.board[self.new_pos]
-        if captured:
-            score += captured.capture_score
-        return score
+    @property
+    def board(self):
+        return self.piece.board
 
-    def evaluate_complete(self):
-        log.debug('evaluating %s...' % self)
-        score = self.evaluate()
+    @property
+    def player(self):
+        return self.piece.player
 
-        board = self.board.sandbox
-        board.make_move(self)
-        board.undo_move()
-        score += 0.3 * board.evaluate()
+    @property
+    def old_pos(self):
+        return positions[self.packed >> 6 & 63]
 
-        log.debug('evaluated %s as %f' % (self, score))
-        return score
+    @property
+    def new_pos(self):
+        return positions[self.packed & 63]
+
+    @property
+    def promotion(self):
+        """The piece class a pawn promotes to, None if it does not."""
+        return packed_promotions[self.packed >> 12]
+
+    @property
+    def en_passant(self):
+        captured = self.captured
+        return captured is not None \
+               and captured.pos.index != self.packed & 63
+
+    @property
+    def castling(self):
+        """
+        The squares the rook goes from and to if the king castles, so the
+        rook goes over it, None otherwise.
+        """
+        if self.piece.__class__ is not King:
+            return None
+        old, new = self.packed >> 6 & 63, self.packed & 63
+        if abs(new - old) != 2:
+            return None
+        rook = old + 3 if new > old else old - 4
+        return positions[rook], positions[(old + new) // 2]
 
     @property
     def promotion_sign(self):
-        # TODO
-        return '' if not self.promotion else 'q'
+        return '' if not self.promotion else self.promotion.pgn_signs[0].lower()
 
     def __str__(self):
         return '%s%s%s%s' % (self.piece.sign, self.old_pos, self.new_pos,
@@ -219,31 +554,74 @@ class Move:
     def __eq__(self, other):
         if isinstance(other, str):
             return self.notation == other
-        return self.old_pos == other.old_pos and self.new_pos == other.new_pos
+        return self.packed == other.packed
 
     # TODO same as for __eq__
     def __hash__(self):
-        return hash(self.notation)
+        return self.packed
 
 
 class Piece:
+    __slots__ = ('player', 'board', 'pos', 'zobrist_offset', 'square_scores')
+
     def __init__(self, player, board, column, row):
         self.player = player
         self.board = board
         self.pos = Position(column, row)
+        white = player.color == Player.Color.white
+        self.zobrist_offset = 64 * (2 * self.zobrist_index + white)
+        self.square_scores = self.psqt[white]
 
     @property
-    def all_dirs(self):
-        dirs = []
-        for dir in self.quadrant_dirs:
-            dirs += dir.mirrors
-            dirs += dir.switched.mirrors
-        return set(dirs)
+    def key(self):
+        """Zobrist key of the piece on its current square."""
+        return zobrist_keys[self.zobrist_offset + self.pos.index]
+
+    @property
+    def score(self):
+        """
+        Material and piece-square score of the piece on its current square,
+        positive for white and negative for black.
+        """
+        return self.square_scores[self.pos.index]
+
+    sliding = False
+
+    # per square index, a list of rays (lists of positions going away from
+    # the square) the piece can move along, see init_rays
+    rays = None
 
     def possible_moves(self):
-        for dir in self.all_dirs:
-            pos = self.pos + dir
-            if self.check_move_to(pos):
+        squares = self.board.squares
+        player = self.player
+        for ray in self.rays[self.pos.index]:
+            for pos in ray:
+                destination = squares[pos.index]
+                if destination:
+                    if destination.player is not player:
+                        yield Move(self, pos)
+                    break
+                yield Move(self, pos)
+
+    def capture_moves(self):
+        """The possible moves which capture."""
+        squares = self.board.squares
+        player = self.player
+        for ray in self.rays[self.pos.index]:
+            for pos in ray:
+                destination = squares[pos.index]
+                if destination:
+                    if destination.player is not player:
+                        yield Move(self, pos)
+                    break
+
+    def quiet_moves(self):
+        """The possible moves which do not capture."""
+        squares = self.board.squares
+        for ray in self.rays[self.pos.index]:
+            for pos in ray:
+                if squares[pos.index]:
+                    break
                 yield Move(self, pos)
 
     def check_move_to(self, pos):
@@ -252,31 +630,41 @@ class Piece:
         destination = self.board[pos]
         if destination and destination.player == self.player:
             return False
-        # TODO check for check
         return True
 
-    def straight_line_to(self, end_pos):
-        dir = (end_pos - self.pos).normalized
-        pos = self.pos + dir
-        while pos != end_pos and pos.is_valid:
-            if self.board[pos]:
-                return False
-            pos += dir
-        return True
+    def mobility(self):
+        """
+        Number of squares the piece can move to and the sum of capture
+        scores of opponent's pieces it attacks.
+        """
+        squares = self.board.squares
+        player = self.player
+        moves = attacked = 0
+        for ray in self.rays[self.pos.index]:
+            for pos in ray:
+                destination = squares[pos.index]
+                if destination:
+                    if destination.player is not player:
+                        moves += 1
+                        attacked += destination.capture_score
+                    break
+                moves += 1
+        return moves, attacked
 
     def evaluate(self):
-        score = 0
-        for move in self.possible_moves():
-            score += move.evaluate()
-        return score
+        return self.mobility()[1]
 
     def leave(self):
         """Removes itself from playing pieces."""
         self.player.pieces.remove(self)
+        squares = self.board.squares
+        if squares[self.pos.index] is self:
+            squares[self.pos.index] = None
 
     def join(self):
         """Joins the game."""
         self.player.pieces.append(self)
+        self.board.squares[self.pos.index] = self
 
     def __repr__(self):
         return '<%s on %s>' % (self.sign, self.pos)
@@ -287,52 +675,99 @@ class Piece:
 
 
 class King(Piece):
+    __slots__ = ()
     capture_score = 1000
+    value = 0
+    zobrist_index = 5
     quadrant_dirs = [
         Direction(0, 1),
         Direction(1, 1),
     ]
     pgn_signs = ['K']
 
-
-class StraightLineMixin:
-    def check_move_to(self, pos):
-        return super().check_move_to(pos) and self.straight_line_to(pos)
-
-
-class Rook(StraightLineMixin, Piece):
+    def possible_moves(self):
+        yield from super().possible_moves()
+        yield from self.castling_moves()
+
+    def quiet_moves(self):
+        yield from super().quiet_moves()
+        yield from self.castling_moves()
+
+    def castling_moves(self):
+        board = self.board
+        rights = board.castling
+        if not rights:
+            return
+        kingside, queenside = ('K', 'Q') if self.player == board.white \
+                              else ('k', 'q')
+        row = self.pos.row
+        for right, path, passed in [
+            (kingside, [6, 7], 6),
+            (queenside, [4, 3, 2], 4),
+        ]:
+            if right not in rights:
+                continue
+            if any(board[column, row] for column in path):
+                continue
+            opponent = board.other(self.player)
+            if any(board.is_attacked(Position(column, row), opponent)
+                   for column in [self.pos.column, passed]):
+                continue
+            yield Move(self, Position(path[1], row))
+
+
+class Rook(Piece):
+    __slots__ = ()
     capture_score = 30
-    quadrant_dirs = [Direction(0, i) for i in range(1, 9)]
+    value = 500
+    zobrist_index = 3
+    quadrant_dirs = [Direction(0, 1)]
+    sliding = True
     pgn_signs = ['R']
 
 
-class Bishop(StraightLineMixin, Piece):
+class Bishop(Piece):
+    __slots__ = ()
     capture_score = 20
-    quadrant_dirs = [Direction(i, i) for i in range(1, 9)]
+    value = 330
+    zobrist_index = 2
+    quadrant_dirs = [Direction(1, 1)]
+    sliding = True
     pgn_signs = ['B']
 
 
-class Queen(StraightLineMixin, Piece):
+class Queen(Piece):
+    __slots__ = ()
     capture_score = 50
+    value = 900
+    zobrist_index = 4
     quadrant_dirs = Rook.quadrant_dirs + Bishop.quadrant_dirs
+    sliding = True
     pgn_signs = ['Q']
 
 
 class Knight(Piece):
+    __slots__ = ()
     capture_score = 15
+    value = 320
+    zobrist_index = 1
     quadrant_dirs = [Direction(2, 1)]
     pgn_signs = ['N']
 
 
 class Pawn(Piece):
+    __slots__ = ('heading', 'starting_row', 'dir_forward', 'dir_forward_2',
+                 'dir_captures')
     capture_score = 1
+    value = 100
+    zobrist_index = 0
     pgn_signs = [None, '', 'P']
 
     def __init__(self, *args, **kwargs):
         self.heading = kwargs.pop('heading')
         super().__init__(*args, **kwargs)
 
-        self.starting_pos = self.pos
+        self.starting_row = 2 if self.heading == 1 else 7
         self.dir_forward = Direction(0, self.heading)
         self.dir_forward_2 = Direction(0, 2 * self.heading)
         self.dir_captures = [
@@ -340,26 +775,201 @@ class Pawn(Piece):
             Direction(-1, self.heading),
         ]
 
-    # TODO starting example
     @property
     def all_dirs(self):
         yield self.dir_forward
+        en_passant = self.board.en_passant
         for dir in self.dir_captures:
-            capture = self.board[self.pos + dir]
-            if capture and capture.player != self.player:
+            pos = self.pos + dir
+            capture = self.board[pos]
+            if capture and capture.player != self.player \
+                    or en_passant and pos == en_passant:
                 yield dir
-        if self.pos == self.starting_pos:
+        if self.pos.row == self.starting_row:
             if not self.board[self.pos + self.dir_forward]:
                 yield self.dir_forward_2
 
+    def possible_moves(self):
+        for dir in self.all_dirs:
+            yield from self.moves_to(self.pos + dir)
+
+    def capture_moves(self):
+        """Captures, en passant included, and promotions."""
+        for dir in self.all_dirs:
+            pos = self.pos + dir
+            if dir is self.dir_forward_2 \
+                    or dir is self.dir_forward and pos.row not in [1, 8]:
+                continue
+            yield from self.moves_to(pos)
+
+    def quiet_moves(self):
+        for dir in self.all_dirs:
+            pos = self.pos + dir
+            if dir is self.dir_forward_2 \
+                    or dir is self.dir_forward and pos.row not in [1, 8]:
+                yield from self.moves_to(pos)
+
+    def moves_to(self, pos):
+        if self.check_move_to(pos):
+            if pos.row in [1, 8]:
+                for promotion in promotion_pieces.values():
+                    yield Move(self, pos, promotion=promotion)
+            else:
+                yield Move(self, pos)
+
     def check_move_to(self, pos):
         if pos.column == self.pos.column:
-            # TODO en passant
             destination = self.board[pos]
             if destination:
                 return False
         return super().check_move_to(pos)
 
+    def mobility(self):
+        squares = self.board.squares
+        player = self.player
+        moves = attacked = 0
+        for pos in self.captures[self.heading][self.pos.index]:
+            destination = squares[pos.index]
+            if destination and destination.player is not player:
+                moves += 1
+                attacked += destination.capture_score
+        return moves, attacked
+
+    # per heading and square index, positions a pawn captures on
+    captures = None
+
+
+promotion_pieces = {
+    'q': Queen,
+    'r': Rook,
+    'b': Bishop,
+    'n': Knight,
+}
+
+# promotion pieces by their code in packed moves
+packed_promotions = [None, Knight, Bishop, Rook, Queen]
+
+
+def pack_move(old_index, new_index, promotion=None):
+    """
+    A move as a 16 bit int laid out as in Polyglot books: the square index
+    moved to, the one moved from << 6 and the promotion piece << 12.
+    """
+    return new_index | old_index << 6 \
+           | (packed_promotions.index(promotion) << 12 if promotion else 0)
+
+# all squares by their index
+positions = [Position(index % 8 + 1, index // 8 + 1) for index in range(64)]
+
+
+def init_rays(piece_class):
+    """
+    Precomputes rays of the piece class for every square, so the moves
+    do not have to be searched for again.
+    """
+    dirs = set()
+    for dir in piece_class.quadrant_dirs:
+        dirs.update(dir.mirrors)
+        dirs.update(dir.switched.mirrors)
+    piece_class.rays = []
+    for start in positions:
+        rays = []
+        for dir in sorted(dirs, key=hash):
+            ray = []
+            pos = start + dir
+            while pos.is_valid:
+                ray.append(positions[pos.index])
+                if not piece_class.sliding:
+                    break
+                pos += dir
+            if ray:
+                rays.append(ray)
+        piece_class.rays.append(rays)
+
+
+for piece_class in [King, Queen, Rook, Bishop, Knight]:
+    init_rays(piece_class)
+
+Pawn.captures = {
+    heading: [[positions[(start + dir).index]
+               for dir in [Direction(-1, heading), Direction(1, heading)]
+               if (start + dir).is_valid]
+              for start in positions]
+    for heading in [1, -1]
+}
+
+
+# piece-square bonuses from white's point of view, the 8th row first
+square_tables = {
+    Pawn: [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    Knight: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    Bishop: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    Rook: [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    Queen: [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    King: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+for piece_class, table in square_tables.items():
+    # keyed by whether the piece is white, black reads the table mirrored
+    piece_class.psqt = {
+        True: [piece_class.value + table[index ^ 56] for index in range(64)],
+        False: [-piece_class.value - table[index] for index in range(64)],
+    }
+
 
 class Player:
     class Color(Enum):
@@ -385,11 +995,22 @@ class Player:
         },
     }
 
-    def __init__(self, color, board):
+    def __init__(self, color, board, setup=True):
+        """
+        Starts with the pieces on their initial squares, or with none if not
+        setup.
+        """
         self.color = color
         self.board = board
+        self.heading = 1 if color == Player.Color.white else -1
+        self.pieces = []
+        self.king = None
+        if setup:
+            self.setup()
+
+    def setup(self):
         kwargs = {'player': self, 'board': self.board}
-        if color == Player.Color.white:
+        if self.color == Player.Color.white:
             kwargs.update({'row': 1})
             pawn_kwargs = kwargs.copy()
             pawn_kwargs.update({'row': 2, 'heading': 1})
@@ -405,169 +1026,2943 @@ class Player:
             [Rook(column=c, **kwargs) for c in [1, 8]] +
             [Pawn(column=c, **pawn_kwargs) for c in range(1, 9)]
         )
+        self.king = self.pieces[0]
+
+    def add_piece(self, piece_class, column, row):
+        kwargs = {}
+        if piece_class is Pawn:
+            kwargs['heading'] = self.heading
+        piece = piece_class(self, self.board, column, row, **kwargs)
+        self.pieces.append(piece)
+        if piece_class is King:
+            self.king = piece
+        return piece
+
+    def piece_sign(self, piece):
+        return self.pieces_signs[self.color][piece]
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results indexed by Board.key.
+
+    Every slot keeps one entry (key, depth, score, bound, move, age), the
+    move packed as in Move.packed. A new entry replaces the stored one if
+    that belongs to the same position, to an older search or was searched
+    less deep.
+    """
+
+    # score bound types
+    exact = 0
+    lower = 1
+    upper = 2
+
+    # rough memory taken by a filled slot, in bytes
+    entry_size = 128
+
+    def __init__(self, size_mb=16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.size = max(1, size_mb * 2 ** 20 // self.entry_size)
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+
+    def new_search(self):
+        self.age += 1
+
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, move=None):
+        index = key % self.size
+        entry = self.entries[index]
+        if entry and entry[0] != key and entry[5] == self.age \
+                and entry[1] > depth:
+            return
+        if move is None and entry and entry[0] == key:
+            move = entry[4]
+        self.entries[index] = (key, depth, score, bound, move, self.age)
+
+    @property
+    def usage(self):
+        """Filled part of the table in permille, as UCI hashfull."""
+        sample = self.entries[:1000]
+        return 1000 * sum(1 for entry in sample if entry) // len(sample)
 
-    def rnd_move(self):
+
+class OpeningBook:
+    """
+    Polyglot opening book: 16 byte big-endian entries of key, move, weight
+    and learn data, sorted by key. The file is memory-mapped and binary
+    searched by Board.key, never read as a whole.
+    """
+
+    entry = struct.Struct('>QHHI')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            # an empty file cannot be mapped
+            self.data = b''
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // self.entry.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def entries(self, key):
+        """Yields (move, weight) of the entries of key."""
+        entry_size = self.entry.size
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry.unpack_from(self.data,
+                                      middle * entry_size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        for index in range(low, self.size):
+            entry_key, move, weight, _ = self.entry.unpack_from(
+                self.data, index * entry_size)
+            if entry_key != key:
+                break
+            yield move, weight
+
+    def move(self, board, packed):
+        """
+        Packed move of a book entry, in which castling is written as the
+        king taking its rook.
+        """
+        old_index = packed >> 6 & 63
+        new_index = packed & 63
+        if isinstance(board.squares[old_index], King) and old_index % 8 == 4 \
+                and new_index % 8 in [0, 7] \
+                and new_index // 8 == old_index // 8:
+            new_index = old_index + (2 if new_index > old_index else -2)
+            return pack_move(old_index, new_index)
+        return packed
+
+    def moves(self, board):
+        """Legal book moves of the position with their weights."""
+        moves = []
+        for move, weight in self.entries(board.key):
+            move = board.legal_move(self.move(board, move))
+            if move:
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, board):
+        """A book move picked at random by weight, None out of the book."""
+        moves = [(move, weight) for move, weight in self.moves(board)
+                 if weight]
+        if not moves:
+            return None
+        move, weight = zip(*moves)
+        return random.choices(move, weight)[0]
+
+
+class AnalysisCache:
+    """
+    Search results kept on disk in SQLite across runs: the best move
+    (packed as in Move.packed), score and depth by Board.key, with the
+    nodes and seconds the search took.
+
+    The database is opened on first use. Results are written by a
+    background thread, a deeper result replaces a shallower one. Beyond
+    max_entries, the shallowest and then least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, path, max_entries=1000000, min_depth=6):
+        """
+        Only results searched at least min_depth deep are stored, whether
+        one does for a search is up to Search.satisfied_by.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.min_depth = min_depth
+        self.db = None
+        self.lock = threading.Lock()
+        # (key, move, score, depth, nodes, seconds) to store, or (key,) to
+        # mark used
+        self.writes = queue.Queue()
+        self.writer = None
+        # results queued but not written yet, by key
+        self.pending = {}
+        # rows in the database, counted once when it is opened
+        self.count = 0
+
+    @staticmethod
+    def db_key(key):
+        """The unsigned 64 bit key as an SQLite integer."""
+        return key - 2 ** 64 if key >= 2 ** 63 else key
+
+    def open(self):
+        with self.lock:
+            if self.db:
+                return
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS analysis ('
+                            'key INTEGER PRIMARY KEY, move INTEGER, '
+                            'score INTEGER, depth INTEGER, nodes INTEGER, '
+                            'seconds REAL, used REAL)')
+            # in eviction order
+            self.db.execute('CREATE INDEX IF NOT EXISTS analysis_eviction '
+                            'ON analysis (depth, used)')
+            self.db.commit()
+            self.count = self.db.execute('SELECT COUNT(*) FROM analysis') \
+                .fetchone()[0]
+            self.writer = threading.Thread(target=self.write, daemon=True)
+            self.writer.start()
+
+    def probe(self, key):
+        """
+        (move, score, depth, nodes, seconds) stored for key, None if
+        unknown.
+        """
+        self.open()
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key]
+            row = self.db.execute(
+                'SELECT move, score, depth, nodes, seconds FROM analysis '
+                'WHERE key = ?',
+                (self.db_key(key),)).fetchone()
+        if row:
+            self.writes.put((key,))
+        return row
+
+    def store(self, key, move, score, depth, nodes, seconds):
+        if depth < self.min_depth:
+            return
+        self.open()
+        with self.lock:
+            stored = self.pending.get(key)
+            if stored and stored[2] > depth:
+                return
+            self.pending[key] = (move, score, depth, nodes, seconds)
+        self.writes.put((key, move, score, depth, nodes, seconds))
+
+    def write(self):
+        """
+        Writes queued results in batches, on the writer thread, until None
+        is queued.
+        """
         while True:
+            batch = [self.writes.get()]
+            while not self.writes.empty():
+                batch.append(self.writes.get())
+            now = time.time()
+            with self.lock:
+                for item in batch:
+                    if item is None:
+                        continue
+                    if len(item) == 1:
+                        self.db.execute(
+                            'UPDATE analysis SET used = ? WHERE key = ?',
+                            (now, self.db_key(item[0])))
+                        continue
+                    key, *result = item
+                    values = tuple(result) + (now, self.db_key(key))
+                    if self.db.execute(
+                            'INSERT OR IGNORE INTO analysis (move, score, '
+                            'depth, nodes, seconds, used, key) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)', values).rowcount:
+                        self.count += 1
+                    else:
+                        self.db.execute(
+                            'UPDATE analysis SET move = ?, score = ?, '
+                            'depth = ?, nodes = ?, seconds = ?, used = ? '
+                            'WHERE key = ? AND depth <= ?',
+                            values + (result[2],))
+                    if self.pending.get(key) == tuple(result):
+                        del self.pending[key]
+                self.evict()
+                self.db.commit()
+            for _ in batch:
+                self.writes.task_done()
+            if None in batch:
+                return
+
+    def evict(self):
+        excess = self.count - self.max_entries
+        if excess > 0:
+            self.count -= self.db.execute(
+                'DELETE FROM analysis WHERE key IN (SELECT key FROM analysis '
+                'ORDER BY depth, used LIMIT ?)', (excess,)).rowcount
+
+    def flush(self):
+        """Waits for the queued results to be written."""
+        if self.writer:
+            self.writes.join()
+
+    def close(self):
+        if not self.writer:
+            return
+        self.writes.put(None)
+        self.writer.join()
+        self.db.close()
+        self.db = self.writer = None
+
+
+class Evaluator:
+    """
+    Static evaluation of a position, in centipawns from the point of view
+    of the side to move. Boards delegate Board.evaluate to their evaluator,
+    so search code can swap implementations.
+    """
+
+    def evaluate(self, board):
+        raise NotImplementedError
+
+
+class MaterialEvaluator(Evaluator):
+    """
+    Material and piece-square tables, read from Board.psqt which make_move
+    and undo_move update by deltas.
+    """
+
+    def evaluate(self, board):
+        return board.psqt if board.active is board.white else -board.psqt
+
+
+class MobilityEvaluator(MaterialEvaluator):
+    """
+    Adds the number of squares the pieces reach and the capture scores of
+    the pieces they attack, at the cost of walking the rays of all pieces.
+    """
+
+    mobility_weight = 4
+    attack_weight = 1
+
+    def evaluate(self, board):
+        score = super().evaluate(board)
+        for player, sign in [(board.active, 1), (board.opponent, -1)]:
+            for piece in player.pieces:
+                moves, attacked = piece.mobility()
+                score += sign * (self.mobility_weight * moves +
+                                 self.attack_weight * attacked)
+        return score
+
+
+def popcount(bitboards):
+    """Number of squares in each of the uint64 bitboards, as int64."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitboards).astype(np.int64)
+    return np.unpackbits(bitboards.view(np.uint8).reshape(-1, 8), axis=1) \
+        .sum(axis=1, dtype=np.int64)
+
+
+class PawnTable:
+    """
+    Fixed number of pawn structure scores indexed by Board.pawn_key, a new
+    score replacing the one in its slot. Counts probes and hits to size it
+    by.
+    """
+
+    def __init__(self, size=16384):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """The score stored for key, None if there is none."""
+        self.probes += 1
+        entry = self.entries[key % self.size]
+        if entry and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def store(self, key, score):
+        self.entries[key % self.size] = (key, score)
+
+    def __reduce__(self):
+        # scores are looked up again rather than copied to other processes
+        return self.__class__, (self.size,)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0
+
+
+class PawnStructureEvaluator(Evaluator):
+    """
+    Adds penalties for doubled and isolated pawns and bonuses for passed
+    ones to the score of another evaluator, MaterialEvaluator by default.
+    Pawns move rarely, so the score of a pawn structure is computed once
+    and then looked up in a PawnTable.
+    """
+
+    doubled_penalty = 10
+    isolated_penalty = 15
+    # by rows advanced from the pawn's own first row
+    passed_bonus = [0, 5, 10, 20, 35, 60, 100, 0]
+
+    def __init__(self, evaluator=None, pawn_table=None):
+        self.evaluator = evaluator or MaterialEvaluator()
+        self.pawn_table = pawn_table or PawnTable()
+
+    def evaluate(self, board):
+        score = self.pawn_score(board)
+        return self.evaluator.evaluate(board) \
+            + (score if board.active is board.white else -score)
+
+    def pawn_score(self, board):
+        """Score of the pawn structure, white positive."""
+        score = self.pawn_table.probe(board.pawn_key)
+        if score is None:
+            score = self.score_pawns(board)
+            self.pawn_table.store(board.pawn_key, score)
+        return score
+
+    def score_pawns(self, board):
+        # rows of the pawns of each color by column, 0 and 9 off the board
+        rows = {}
+        for player in [board.white, board.black]:
+            rows[player] = [[] for _ in range(10)]
+            for piece in player.pieces:
+                if piece.__class__ is Pawn:
+                    rows[player][piece.pos.column].append(piece.pos.row)
+
+        score = 0
+        for player, sign in [(board.white, 1), (board.black, -1)]:
+            own, opponent = rows[player], rows[board.other(player)]
+            for column in range(1, 9):
+                pawns = own[column]
+                if not pawns:
+                    continue
+                score -= sign * self.doubled_penalty * (len(pawns) - 1)
+                if not own[column - 1] and not own[column + 1]:
+                    score -= sign * self.isolated_penalty * len(pawns)
+                for row in pawns:
+                    if not any((row_ahead - row) * sign > 0
+                               for adjacent in range(column - 1, column + 2)
+                               for row_ahead in opponent[adjacent]):
+                        advanced = row - 1 if sign > 0 else 8 - row
+                        score += sign * self.passed_bonus[advanced]
+        return score
+
+
+class BatchEvaluator:
+    """
+    Evaluates many positions at once with NumPy, scoring as
+    MaterialEvaluator, or as MobilityEvaluator with mobility.
+
+    Positions are (N, 64) int8 arrays of piece codes by square index, see
+    encode: 0 for an empty square, zobrist_index + 1 for a white piece and
+    its negation for a black one. Mobility is counted on bitboards, one
+    uint64 per position and piece code, filling the rays of all pieces
+    going in a direction at once: rays of one side in one direction do
+    not overlap, so the fills count each piece's squares once.
+    """
+
+    # piece classes by their code
+    piece_classes = [Pawn, Knight, Bishop, Rook, Queen, King]
+
+    def __init__(self, mobility=False):
+        if np is None:
+            raise ImportError('batch evaluation needs NumPy')
+        self.mobility = mobility
+        # psqt[code + 6, index], white positive
+        self.psqt = np.zeros((13, 64), dtype=np.int32)
+        for code, piece_class in enumerate(self.piece_classes, 1):
+            self.psqt[6 + code] = piece_class.psqt[True]
+            self.psqt[6 - code] = piece_class.psqt[False]
+        self.squares = np.arange(64)
+        # per column difference of a shift, the squares it may land on
+        self.column_masks = {
+            column: np.uint64(sum(1 << pos.index for pos in positions
+                                  if 1 <= pos.column - column <= 8))
+            for column in range(-4, 5)
+        }
+
+        # (codes of the pieces moving along, direction, whether sliding),
+        # sliders share the fills of their directions
+        self.directions = []
+        sliding = {}
+        for code, piece_class in enumerate(self.piece_classes, 1):
+            if piece_class is Pawn:
+                continue
+            dirs = set()
+            for dir in piece_class.quadrant_dirs:
+                dirs.update(dir.mirrors)
+                dirs.update(dir.switched.mirrors)
+            for dir in sorted(dirs, key=hash):
+                if piece_class.sliding:
+                    sliding.setdefault(dir, []).append(code)
+                else:
+                    self.directions.append(([code], dir, False))
+        self.directions += [(codes, dir, True)
+                            for dir, codes in sliding.items()]
+
+    @classmethod
+    def encode(cls, boards):
+        """
+        The positions of boards as an (N, 64) int8 array and whether white
+        is to move in them as an (N,) bool array.
+        """
+        squares = np.zeros((len(boards), 64), dtype=np.int8)
+        white = np.zeros(len(boards), dtype=bool)
+        for i, board in enumerate(boards):
+            for piece in board.pieces:
+                code = piece.zobrist_index + 1
+                squares[i, piece.pos.index] = \
+                    code if piece.player is board.white else -code
+            white[i] = board.active is board.white
+        return squares, white
+
+    def evaluate(self, squares, white=None):
+        """
+        Scores of the positions from the point of view of the side to move,
+        white unless white is False for the position.
+        """
+        squares = np.asarray(squares, dtype=np.int8).reshape(-1, 64)
+        scores = self.psqt[squares.astype(np.intp) + 6, self.squares] \
+            .sum(axis=1, dtype=np.int64)
+        if self.mobility:
+            scores += self.evaluate_mobility(squares)
+        if white is not None:
+            scores[~np.asarray(white, dtype=bool)] *= -1
+        return scores
+
+    @staticmethod
+    def bitboards(squares):
+        """Per piece code, the squares it is on as (N,) uint64."""
+        return {
+            code: np.packbits(squares == code, axis=1, bitorder='little')
+                  .view('<u8')[:, 0]
+            for code in range(-6, 7) if code
+        }
+
+    def shift(self, bitboards, dir):
+        """Moves the squares of bitboards by dir, dropping the off-board."""
+        step = 8 * dir.row + dir.column
+        if step > 0:
+            shifted = bitboards << np.uint64(step)
+        else:
+            shifted = bitboards >> np.uint64(-step)
+        return shifted & self.column_masks[dir.column]
+
+    def evaluate_mobility(self, squares):
+        """MobilityEvaluator's terms from white's point of view."""
+        bitboards = self.bitboards(squares)
+        occupied = np.zeros(len(squares), dtype=np.uint64)
+        for bitboard in bitboards.values():
+            occupied |= bitboard
+        empty = ~occupied
+        scores = np.zeros(len(squares), dtype=np.int64)
+        for color in [1, -1]:
+            own = np.zeros(len(squares), dtype=np.uint64)
+            for code in range(1, 7):
+                own |= bitboards[color * code]
+            enemies = [(piece_class.capture_score, bitboards[-color * code])
+                       for code, piece_class
+                       in enumerate(self.piece_classes, 1)]
+
+            attack_sets = []
+            for codes, dir, sliding in self.directions:
+                pieces = bitboards[color * codes[0]]
+                for code in codes[1:]:
+                    pieces = pieces | bitboards[color * code]
+                if sliding:
+                    pieces = self.fill(pieces, empty, dir)
+                attack_sets.append((self.shift(pieces, dir), False))
+            pawns = bitboards[color]
+            for column in [-1, 1]:
+                attack_sets.append((self.shift(pawns, Direction(column, color)),
+                                    True))
+
+            moves = attacked = 0
+            for attacks, captures_only in attack_sets:
+                for capture_score, enemy in enemies:
+                    count = popcount(attacks & enemy)
+                    attacked = attacked + capture_score * count
+                    if captures_only:
+                        moves = moves + count
+                if not captures_only:
+                    moves = moves + popcount(attacks & ~own)
+            scores += color * (MobilityEvaluator.mobility_weight * moves
+                               + MobilityEvaluator.attack_weight * attacked)
+        return scores
+
+    def fill(self, pieces, empty, dir):
+        """
+        The squares of pieces and the empty ones they slide to along dir,
+        by Kogge-Stone doubling.
+        """
+        for _ in range(3):
+            pieces = pieces | empty & self.shift(pieces, dir)
+            empty = empty & self.shift(empty, dir)
+            dir = Direction(2 * dir.column, 2 * dir.row)
+        return pieces
+
+
+class MoveOrderer:
+    """
+    Orders moves for alpha-beta: the transposition table move first, then
+    captures and promotions by MVV-LVA on capture scores, then the killer
+    moves of the ply, then quiet moves by the history heuristic.
+
+    Counts beta cutoffs and how many of them the first move caused, the
+    measure of how good the ordering is.
+    """
+
+    tt_score = 1 << 40
+    capture_score = 1 << 30
+    killer_score = 1 << 29
+    killers_per_ply = 2
+
+    def __init__(self, max_ply):
+        self.killers = [[] for _ in range(max_ply + 1)]
+        # by Piece.zobrist_offset + square index the piece moved to
+        self.history = [0] * 12 * 64
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def score(self, move, tt_move, ply):
+        if move.packed == tt_move:
+            return self.tt_score
+        if move.captured or move.promotion:
+            # most valuable victim, least valuable attacker
+            victim = move.captured.capture_score if move.captured else 0
+            if move.promotion:
+                victim += move.promotion.capture_score
+            return self.capture_score + 1024 * victim \
+                   - move.piece.capture_score
+        killers = self.killers[ply]
+        if killers and move.packed in killers:
+            return self.killer_score - killers.index(move.packed)
+        return self.history[move.piece.zobrist_offset + move.new_pos.index]
+
+    def order(self, moves, tt_move=None, ply=0):
+        return sorted(moves, key=lambda move: self.score(move, tt_move, ply),
+                      reverse=True)
+
+    def cutoff(self, move, ply, depth, index):
+        """Records that move, index-th in the order, failed high."""
+        self.cutoffs += 1
+        if not index:
+            self.first_move_cutoffs += 1
+        if move.captured or move.promotion:
+            return
+        killers = self.killers[ply]
+        if move.packed not in killers:
+            killers.insert(0, move.packed)
+            del killers[self.killers_per_ply:]
+        self.history[move.piece.zobrist_offset + move.new_pos.index] += \
+            depth * depth
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class Search:
+    """
+    Negamax alpha-beta search with iterative deepening.
+
+    Every iteration searches one ply deeper than the previous one, its
+    principal variation and score are kept in self.pv and self.score.
+    Running out of nodes or time, or stop() called from another thread,
+    abandons the current iteration and keeps the last finished one; the
+    first iteration is always finished.
+
+    The limits are those of UCI go: depth, nodes, movetime (all times in
+    milliseconds), the clocks wtime/btime with increments winc/binc and
+    movestogo moves to the next time control, or infinite. A ponder search
+    ignores the time limits until ponderhit().
+
+    With multipv, every iteration searches the root again without the
+    best moves found so far, sharing the transposition table, and keeps
+    the multipv best lines ranked in self.lines.
+
+    Counts nodes (quiescence ones also as qnodes), transposition table
+    hits and the time spent generating moves and evaluating, see stats().
+    """
+
+    mate_score = 100000
+    max_ply = 64
+    default_depth = 3
+
+    # milliseconds kept for communication lag
+    move_overhead = 30
+    # moves assumed to be left when the time control does not say
+    default_movestogo = 30
+    # nodes between checks of the clock
+    check_interval = 256
+
+    def __init__(self, board, depth=None, nodes=None, movetime=None,
+                 wtime=None, btime=None, winc=0, binc=0, movestogo=None,
+                 infinite=False, ponder=False, root_moves=None, multipv=1,
+                 stop_event=None, on_info=None, profile=None):
+        """
+        root_moves restricts the moves searched at the root to the given
+        notations, as UCI go searchmoves. multipv is the number of best
+        lines searched for. stop_event is polled as another way to stop().
+        on_info is called with the UCI info lines of every finished
+        iteration. The search runs under cProfile if profile names a file
+        for the report.
+        """
+        self.board = board
+        self.tt = board.tt
+        self.max_nodes = nodes
+        self.root_moves = root_moves
+        self.multipv = multipv
+        # packed moves left out at the root, the lines already found
+        self.excluded = []
+        self.stop_event = stop_event
+        self.on_info = on_info
+        self.profile = profile
+        self.infinite = infinite
+        self.pondering = ponder
+        self.soft_time, self.hard_time = self.allocate_time(
+            board.active is board.white, movetime, wtime, btime, winc, binc,
+            movestogo)
+        if depth:
+            self.max_depth = depth
+        elif nodes or infinite or ponder or self.hard_time:
+            self.max_depth = self.max_ply
+        else:
+            self.max_depth = self.default_depth
+
+        self.nodes = 0
+        self.qnodes = 0
+        self.tt_hits = 0
+        self.movegen_time = 0
+        self.eval_time = 0
+        self.depth = 0
+        self.score = None
+        self.pv = []
+        # (score, pv) of each line, the best first
+        self.lines = []
+        self.stopped = False
+        self.start_time = None
+        self.pv_table = [[] for _ in range(self.max_ply + 1)]
+        self.orderer = MoveOrderer(self.max_ply)
+
+    @classmethod
+    def allocate_time(cls, white, movetime=None, wtime=None, btime=None,
+                      winc=0, binc=0, movestogo=None):
+        """
+        Seconds after which no new iteration is started and after which the
+        search is abandoned, (None, None) without a time limit.
+        """
+        if movetime:
+            hard = max(movetime - cls.move_overhead, 1) / 1000
+            return hard, hard
+        left, inc = (wtime, winc) if white else (btime, binc)
+        if left is None:
+            return None, None
+        left = max(left - cls.move_overhead, 1)
+        moves = movestogo or cls.default_movestogo
+        soft = min(left / moves + 3 * (inc or 0) / 4, left / 2)
+        hard = min(3 * soft, left / 2)
+        return soft / 1000, hard / 1000
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def out_of_time(self):
+        return not self.pondering and self.hard_time \
+               and self.elapsed > self.hard_time \
+               or self.stop_event is not None and self.stop_event.is_set()
+
+    def out_of_soft_time(self):
+        """Whether it is too late to start another iteration."""
+        return not self.pondering and self.soft_time \
+               and self.elapsed > self.soft_time
+
+    def stop(self):
+        self.stopped = True
+
+    def ponderhit(self):
+        """
+        The move pondered on was played, the search goes on and the time
+        limits count from now.
+        """
+        if self.start_time is not None:
+            pondered = self.elapsed
+            if self.soft_time:
+                self.soft_time += pondered
+                self.hard_time += pondered
+        self.pondering = False
+
+    def satisfied_by(self, depth, nodes, seconds):
+        """
+        Whether a result searched to depth with nodes in seconds does
+        instead of searching: it is as deep as the depth limit, or took as
+        many nodes or as much time as the limits allow. Infinite and ponder
+        searches are never satisfied.
+        """
+        if self.infinite or self.pondering:
+            return False
+        return depth >= self.max_depth \
+            or bool(self.max_nodes) and nodes >= self.max_nodes \
+            or bool(self.hard_time) and seconds >= self.hard_time
+
+    def run(self):
+        """
+        Searches and returns the principal variation, or the move the
+        board's AnalysisCache has for the position if that is good enough.
+        """
+        cache = self.board.cache \
+            if not self.root_moves and self.multipv == 1 else None
+        if cache and self.probe_cache(cache):
+            return self.pv
+        if not self.profile:
+            pv = self.iterate()
+        else:
+            profiler = cProfile.Profile()
+            pv = profiler.runcall(self.iterate)
+            with open(self.profile, 'w') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative') \
+                    .print_stats()
+        if cache and pv:
+            cache.store(self.board.key, pv[0].packed, self.score, self.depth,
+                        self.nodes, self.elapsed)
+        return pv
+
+    def probe_cache(self, cache):
+        entry = cache.probe(self.board.key)
+        if not entry:
+            return False
+        packed, score, depth, nodes, seconds = entry
+        if not self.satisfied_by(depth, nodes, seconds):
+            return False
+        move = self.board.legal_move(packed)
+        if not move:
+            return False
+        log.debug('cached move %s', move.notation)
+        self.start_time = time.perf_counter()
+        self.depth, self.score, self.pv = depth, score, [move]
+        self.lines = [(score, self.pv)]
+        self.report()
+        return True
+
+    def iterate(self):
+        self.tt.new_search()
+        self.start_time = time.perf_counter()
+        multipv = 1
+        if self.multipv > 1:
+            moves = [move for move in self.board.legal_moves()
+                     if not self.root_moves
+                     or move.notation in self.root_moves]
+            multipv = max(1, min(self.multipv, len(moves)))
+        for depth in range(1, self.max_depth + 1):
+            lines = []
             try:
-                piece = random.choice(self.pieces)
-                move = random.choice(list(piece.possible_moves()))
-                log.debug('rnd_move: %s' % move)
-                return move
-            except IndexError:
-                pass
+                for _ in range(multipv):
+                    score = self.negamax(depth, -self.mate_score - 1,
+                                         self.mate_score + 1, 0)
+                    lines.append((score, self.pv_table[0][:]))
+                    if lines[-1][1]:
+                        self.excluded.append(lines[-1][1][0].packed)
+            except SearchAborted:
+                break
+            finally:
+                self.excluded = []
+            lines.sort(key=lambda line: -line[0])
+            self.depth = depth
+            self.lines = lines
+            self.score, self.pv = lines[0]
+            self.report()
+            if self.stopped \
+                    or abs(self.score) > self.mate_score - self.max_ply:
+                break
+            if self.max_nodes and self.nodes >= self.max_nodes:
+                break
+            if self.out_of_soft_time():
+                break
+        return self.pv
+
+    def report(self):
+        """Tells about a finished iteration."""
+        if self.multipv == 1:
+            infos = [self.info()]
+        else:
+            infos = [self.info(line) for line in range(len(self.lines))]
+        for info in infos:
+            log.debug(info)
+            if self.on_info:
+                self.on_info(info)
+
+    def stats(self):
+        """Counters and timings (in seconds) of the search so far."""
+        seconds = self.elapsed if self.start_time else 0
+        return {
+            'depth': self.depth,
+            'score': self.score,
+            'pv': [move.notation for move in self.pv],
+            'lines': [{'score': score,
+                       'pv': [move.notation for move in pv]}
+                      for score, pv in self.lines],
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'tt_hits': self.tt_hits,
+            'cutoffs': self.orderer.cutoffs,
+            'first_move_cutoff_rate': self.orderer.first_move_cutoff_rate,
+            'nps': int(self.nodes / seconds) if seconds else 0,
+            'hashfull': self.tt.usage,
+            'seconds': seconds,
+            'movegen_seconds': self.movegen_time,
+            'eval_seconds': self.eval_time,
+            'search_seconds': seconds - self.movegen_time - self.eval_time,
+        }
+
+    def info(self, line=None):
+        """
+        UCI info line of the last finished iteration, of its line of that
+        index with multipv.
+        """
+        stats = self.stats()
+        score, pv = (self.score, self.pv) if line is None \
+            else self.lines[line]
+        score = score or 0
+        if score > self.mate_score - self.max_ply:
+            score = 'mate %d' % ((self.mate_score - score + 1) // 2)
+        elif score < -self.mate_score + self.max_ply:
+            score = 'mate -%d' % ((self.mate_score + score) // 2)
+        else:
+            score = 'cp %d' % score
+        multipv = '' if line is None else 'multipv %d ' % (line + 1)
+        return 'info depth %d %sscore %s nodes %d nps %d time %d ' \
+               'hashfull %d pv %s' % (
+                   stats['depth'], multipv, score, stats['nodes'],
+                   stats['nps'], 1000 * stats['seconds'], stats['hashfull'],
+                   ' '.join(move.notation for move in pv))
+
+    def counters(self):
+        """What a worker's search adds to the parallel search's stats."""
+        return {
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'tt_hits': self.tt_hits,
+            'cutoffs': self.orderer.cutoffs,
+            'first_move_cutoffs': self.orderer.first_move_cutoffs,
+            'movegen_time': self.movegen_time,
+            'eval_time': self.eval_time,
+        }
+
+    def generate(self, moves):
+        """Yields moves, adding the time taken to generate them up."""
+        moves = iter(moves)
+        while True:
+            start = time.perf_counter()
+            move = next(moves, None)
+            self.movegen_time += time.perf_counter() - start
+            if move is None:
+                return
+            yield move
+
+    def evaluate(self):
+        start = time.perf_counter()
+        score = self.board.evaluate()
+        self.eval_time += time.perf_counter() - start
+        return score
+
+    def visit(self):
+        """Counts a node, abandons the iteration when out of nodes or time."""
+        self.nodes += 1
+        if self.depth:
+            if self.stopped:
+                raise SearchAborted
+            if self.max_nodes and self.nodes > self.max_nodes:
+                raise SearchAborted
+            if not self.nodes % self.check_interval and self.out_of_time():
+                self.stopped = True
+                raise SearchAborted
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.visit()
+        board = self.board
+        self.pv_table[ply] = []
+
+        entry = self.tt.probe(board.key)
+        tt_move = None
+        if entry:
+            self.tt_hits += 1
+            _, entry_depth, score, bound, tt_move, _ = entry
+            if ply and entry_depth >= depth:
+                score = self.score_from_tt(score, ply)
+                if bound == TranspositionTable.exact \
+                        or bound == TranspositionTable.lower and score >= beta \
+                        or bound == TranspositionTable.upper and score <= alpha:
+                    return score
+
+        if depth == 0 or ply == self.max_ply:
+            return self.quiesce(alpha, beta, ply)
+
+        moves = self.generate(board.staged_moves(
+            tt_move, lambda moves: self.orderer.order(moves, ply=ply)))
+        if not ply and self.root_moves:
+            moves = (move for move in moves
+                     if move.notation in self.root_moves)
+        if not ply and self.excluded:
+            moves = (move for move in moves
+                     if move.packed not in self.excluded)
+
+        alpha_orig = alpha
+        best_score = -self.mate_score - 1
+        best_move = None
+        for index, move in enumerate(moves):
+            board.make_move(move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.undo_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                if alpha >= beta:
+                    self.orderer.cutoff(move, ply, depth, index)
+                    break
+        if not best_move:
+            return -self.mate_score + ply if board.in_check() else 0
+
+        if best_score >= beta:
+            bound = TranspositionTable.lower
+        elif best_score > alpha_orig:
+            bound = TranspositionTable.exact
+        else:
+            bound = TranspositionTable.upper
+        if ply or not self.excluded and not self.root_moves:
+            # the root's best move is not among the excluded or left out
+            # ones
+            self.tt.store(board.key, depth,
+                          self.score_to_tt(best_score, ply), bound,
+                          best_move.packed)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        """
+        Searches captures only until the position is quiet, so that the
+        leaves are not scored in the middle of an exchange. The side to
+        move may stand pat on the static evaluation instead of capturing,
+        captures losing material by static exchange evaluation are not
+        searched.
+        """
+        self.visit()
+        self.qnodes += 1
+        board = self.board
+        best_score = self.evaluate()
+        if best_score >= beta or ply == self.max_ply:
+            return best_score
+        alpha = max(alpha, best_score)
+
+        captures = self.generate(board.staged_moves(
+            order=lambda moves: self.orderer.order(moves, ply=ply),
+            quiet=False))
+        for move in captures:
+            if board.see(move) < 0:
+                continue
+            board.make_move(move)
+            try:
+                score = -self.quiesce(-beta, -alpha, ply + 1)
+            finally:
+                board.undo_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def score_to_tt(self, score, ply):
+        """Mate scores are stored relative to the node, not the root."""
+        if score > self.mate_score - self.max_ply:
+            return score + ply
+        if score < -self.mate_score + self.max_ply:
+            return score - ply
+        return score
+
+    def score_from_tt(self, score, ply):
+        if score > self.mate_score - self.max_ply:
+            return score - ply
+        if score < -self.mate_score + self.max_ply:
+            return score + ply
+        return score
+
+
+class ParallelSearch(Search):
+    """
+    Splits the root moves among worker processes at every iteration, each
+    worker searches its share with its own transposition table and the
+    best of their results wins. Processes sidestep the GIL, at the price of
+    the workers not sharing their alpha-beta bounds.
+    """
+
+    poll_interval = 0.005
+
+    def __init__(self, board, threads=2, **limits):
+        super().__init__(board, **limits)
+        self.threads = threads
+
+    def iterate(self):
+        self.start_time = time.perf_counter()
+        pool, stop_event = worker_pool(self.threads, self.tt.size_mb,
+                                       self.board.evaluator)
+        stop_event.clear()
+
+        board = self.board
+        history = [move.notation for move in board.history]
+        root_moves = [move.notation for move in
+                      self.orderer.order(board.legal_moves())
+                      if not self.root_moves or move.notation in self.root_moves]
+        if not root_moves:
+            self.score = -self.mate_score if board.in_check() else 0
+            return self.pv
+
+        for depth in range(1, self.max_depth + 1):
+            nodes = None
+            if self.max_nodes:
+                nodes = max(1, (self.max_nodes - self.nodes) // self.threads)
+            tasks = [
+                pool.apply_async(search_root_moves, (
+                    board.initial_fen, history, root_moves[i::self.threads],
+                    depth, nodes, self.multipv))
+                for i in range(min(self.threads, len(root_moves)))
+            ]
+            while not all(task.ready() for task in tasks):
+                # the workers finish their first iteration anyway
+                if self.stopped or self.out_of_time():
+                    stop_event.set()
+                time.sleep(self.poll_interval)
+            results = [task.get() for task in tasks]
+            for result in results:
+                self.add_counters(result[2])
+            if any(result[0] < depth for result in results):
+                break
+
+            # the best lines of all the workers
+            lines = sorted((line for result in results for line in result[1]),
+                           key=lambda line: -line[0])[:self.multipv]
+            self.depth = depth
+            self.lines = [(score, board.parse_moves(pv))
+                          for score, pv in lines]
+            score, pv = lines[0]
+            self.score, self.pv = self.lines[0]
+            root_moves.remove(pv[0])
+            root_moves.insert(0, pv[0])
+            self.report()
+            if stop_event.is_set() \
+                    or abs(score) > self.mate_score - self.max_ply:
+                break
+            if self.max_nodes and self.nodes >= self.max_nodes:
+                break
+            if self.out_of_soft_time():
+                break
+        return self.pv
+
+    def add_counters(self, counters):
+        self.nodes += counters['nodes']
+        self.qnodes += counters['qnodes']
+        self.tt_hits += counters['tt_hits']
+        self.orderer.cutoffs += counters['cutoffs']
+        self.orderer.first_move_cutoffs += counters['first_move_cutoffs']
+        self.movegen_time += counters['movegen_time']
+        self.eval_time += counters['eval_time']
+
+
+def new_search(board, threads=1, **limits):
+    if threads > 1:
+        return ParallelSearch(board, threads=threads, **limits)
+    return Search(board, **limits)
+
+
+# pool of worker processes with their stop event, by (processes, hash size,
+# pickled evaluator)
+worker_pools = {}
+# the stop event, transposition table and evaluator of a worker process
+worker_state = {}
+
+
+def worker_pool(processes, hash_mb, evaluator):
+    """
+    The pool of processes workers evaluating with (a copy of) evaluator,
+    created on first use. The workers are spawned rather than forked: a
+    process forked while the UCI loop waits in input() deadlocks on the
+    stdin lock as it starts.
+    """
+    pool_key = (processes, hash_mb, pickle.dumps(evaluator))
+    if pool_key not in worker_pools:
+        close_worker_pools()
+        context = multiprocessing.get_context('spawn')
+        stop_event = context.Event()
+        pool = context.Pool(processes, init_worker,
+                            (stop_event, max(1, hash_mb // processes),
+                             evaluator))
+        worker_pools[pool_key] = (pool, stop_event)
+    return worker_pools[pool_key]
+
+
+def close_worker_pools():
+    for pool, _ in worker_pools.values():
+        pool.terminate()
+        pool.join()
+    worker_pools.clear()
 
-    def piece_sign(self, piece):
-        return self.pieces_signs[self.color][piece]
+
+def init_worker(stop_event, hash_mb, evaluator):
+    worker_state['stop_event'] = stop_event
+    worker_state['tt'] = TranspositionTable(hash_mb)
+    worker_state['evaluator'] = evaluator
+
+
+def search_root_moves(fen, history, root_moves, depth, nodes=None,
+                      multipv=1):
+    """
+    Searches root_moves of the position after history from fen in a worker
+    process, returns the finished depth, the multipv best lines as (score,
+    notations) and the search's counters.
+    """
+    board = worker_state.get('board')
+    if not board:
+        board = worker_state['board'] = Board(
+            tt=worker_state['tt'], evaluator=worker_state['evaluator'],
+            fen=fen)
+    board.sync_moves(history, fen)
+    search = Search(board, depth=depth, nodes=nodes, root_moves=root_moves,
+                    multipv=multipv, stop_event=worker_state['stop_event'])
+    search.run()
+    return (search.depth,
+            [(score, [move.notation for move in pv])
+             for score, pv in search.lines],
+            search.counters())
 
 
 class Board:
-    pgn_re = re.compile(r'('
-        '(?P<round>\d+(\.|\.\.\.))|'
-        '(?P<result>(1-0|0-1|1/2-1/2|\*))|'
-        '(?P<move>\S+)'
-        ')+'
-    )
+    # a king recaptures only where it is not taken back
+    see_king_value = 20000
+
+    # castling rights lost by moving from or capturing on a square
+    castling_squares = {
+        0: 'Q',
+        4: 'KQ',
+        7: 'K',
+        56: 'q',
+        60: 'kq',
+        63: 'k',
+    }
 
-    def __init__(self, sandbox=False):
-        self.white = Player(Player.Color.white, self)
-        self.black = Player(Player.Color.black, self)
+    fen_pieces = {
+        'k': King,
+        'q': Queen,
+        'r': Rook,
+        'b': Bishop,
+        'n': Knight,
+        'p': Pawn,
+    }
+
+    def __init__(self, tt=None, evaluator=None, fen=None, book=None,
+                 cache=None):
+        """
+        Starts from the initial position, or from the one given in FEN.
+        bestmove plays from the OpeningBook book while it knows the
+        position, searches keep their results in the AnalysisCache cache.
+        """
+        self.white = Player(Player.Color.white, self, setup=not fen)
+        self.black = Player(Player.Color.black, self, setup=not fen)
+        self.active = self.white
+        self.opponent = self.black
         self.history = []
-        self.sandbox = Board(sandbox=True) if not sandbox else None
 
-    @property
-    def active(self):
-        return list({self.white, self.black} - {self.history[-1].player})[0] \
-               if self.history else self.white
+        # castling rights as in FEN, e.g. 'KQkq'
+        self.castling = 'KQkq'
+        # square passed over by a pawn's double step in the last move
+        self.en_passant = None
+        # plies since the last capture or pawn move, and the move number
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # (castling, en_passant, key, pawn_key, psqt, halfmove_clock) before
+        # each move of history
+        self.states = []
+
+        if fen:
+            self.load_fen(fen)
+        self.initial_fen = fen or start_fen
+
+        # mailbox, see Position.index
+        self.squares = [None] * 64
+        for piece in self.pieces:
+            self.squares[piece.pos.index] = piece
+
+        self.key = self.compute_key()
+        self.pawn_key = self.compute_pawn_key()
+        self.psqt = self.compute_psqt()
+        self.tt = tt or TranspositionTable()
+        self.evaluator = evaluator or PawnStructureEvaluator()
+        self.book = book
+        self.cache = cache
+
+    def other(self, player):
+        return self.black if player == self.white else self.white
+
+    def load_fen(self, fen):
+        """
+        Places pieces, the side to move, castling rights, the en passant
+        square and the move clocks given in FEN, on a board without pieces.
+        The clocks may be left out.
+        """
+        fields = fen.split()
+        placement, active, castling, en_passant = fields[:4]
+        if len(fields) == 6:
+            self.halfmove_clock = int(fields[4])
+            self.fullmove_number = int(fields[5])
+        for row, pieces in zip(range(8, 0, -1), placement.split('/')):
+            column = 1
+            for char in pieces:
+                if char.isdigit():
+                    column += int(char)
+                    continue
+                player = self.white if char.isupper() else self.black
+                player.add_piece(self.fen_pieces[char.lower()], column, row)
+                column += 1
+        if active == 'b':
+            self.active, self.opponent = self.black, self.white
+        self.castling = castling if castling != '-' else ''
+        self.en_passant = Position(en_passant) if en_passant != '-' else None
+
+    def fen(self):
+        """The position in FEN, as load_fen reads it."""
+        signs = {piece_class: char
+                 for char, piece_class in self.fen_pieces.items()}
+        rows = []
+        for row in range(8, 0, -1):
+            text = ''
+            empty = 0
+            for column in range(1, 9):
+                piece = self.squares[(row - 1) * 8 + column - 1]
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                sign = signs[piece.__class__]
+                text += sign.upper() if piece.player is self.white else sign
+            rows.append(text + (str(empty) if empty else ''))
+        return '%s %s %s %s %d %d' % (
+            '/'.join(rows), 'w' if self.active is self.white else 'b',
+            self.castling or '-', self.en_passant or '-',
+            self.halfmove_clock, self.fullmove_number)
+
+    def compute_key(self):
+        """
+        Zobrist key of the position from scratch, make_move and undo_move
+        keep self.key up to date incrementally.
+        """
+        key = 0
+        for piece in self.pieces:
+            key ^= piece.key
+        for right in self.castling:
+            key ^= zobrist_keys[zobrist_castling[right]]
+        if self.en_passant \
+                and self.can_capture_en_passant(self.en_passant, self.active):
+            key ^= zobrist_keys[zobrist_en_passant + self.en_passant.column]
+        if self.active == self.white:
+            key ^= zobrist_keys[zobrist_white]
+        return key
+
+    def compute_pawn_key(self):
+        """
+        Zobrist key of the pawns alone from scratch, keying PawnTable, kept
+        up to date as self.key.
+        """
+        key = 0
+        for piece in self.pieces:
+            if piece.__class__ is Pawn:
+                key ^= piece.key
+        return key
 
-    @property
-    def opponent(self):
-        return list({self.white, self.black} - {self.active})[0]
+    def can_capture_en_passant(self, en_passant, player):
+        """
+        Whether a pawn of player stands next to the pawn which passed over
+        en_passant. Like Polyglot, the key includes the en passant column
+        only then, so transpositions without the capture hash the same.
+        """
+        squares = self.squares
+        heading = -1 if player is self.white else 1
+        for pos in Pawn.captures[heading][en_passant.index]:
+            piece = squares[pos.index]
+            if piece and piece.player is player and piece.__class__ is Pawn:
+                return True
+        return False
+
+    def compute_psqt(self):
+        """
+        Material and piece-square score from scratch, white positive,
+        make_move and undo_move keep self.psqt up to date incrementally.
+        """
+        return sum(piece.score for piece in self.pieces)
 
     @property
     def pieces(self):
         return self.white.pieces + self.black.pieces
 
     def __getitem__(self, key):
+        """
+        Piece on a square given as a Position, 'e2', (5, 2) or a square index,
+        None for an empty or off-board square.
+        """
+        if isinstance(key, int):
+            return self.squares[key]
         if isinstance(key, tuple):
-            key = Position(key[0], key[1])
+            column, row = key
         elif isinstance(key, str):
-            key = Position(key)
-        return next(filter(lambda piece: piece.pos == key, self.pieces), None)
+            column = ord(key[0]) - ord('a') + 1
+            row = ord(key[1]) - ord('1') + 1
+        else:
+            column, row = key.column, key.row
+        if 1 <= row <= 8 and 1 <= column <= 8:
+            return self.squares[(row - 1) * 8 + column - 1]
+        return None
+
+    # piece classes looking outwards from a square, with the pieces they
+    # find attacking it
+    attacker_classes = [
+        (Knight, (Knight,)),
+        (King, (King,)),
+        (Rook, (Rook, Queen)),
+        (Bishop, (Bishop, Queen)),
+    ]
 
-    def make_move(self, move):
-        if self.sandbox:
-            assert len(self.history) == len(self.sandbox.history)
-            if self.history:
-                assert self.history[-1] == self.sandbox.history[-1]
+    def attackers(self, pos, player):
+        """Yields player's pieces attacking pos."""
+        squares = self.squares
+        index = pos.index
+        for piece_class, attackers in self.attacker_classes:
+            for ray in piece_class.rays[index]:
+                for ray_pos in ray:
+                    piece = squares[ray_pos.index]
+                    if piece:
+                        if piece.player is player \
+                                and piece.__class__ in attackers:
+                            yield piece
+                        break
+        # squares from which player's pawns capture on pos
+        heading = -1 if player is self.white else 1
+        for pawn_pos in Pawn.captures[heading][index]:
+            piece = squares[pawn_pos.index]
+            if piece and piece.player is player and piece.__class__ is Pawn:
+                yield piece
+
+    def is_attacked(self, pos, player):
+        """Whether any of player's pieces attacks pos."""
+        for _ in self.attackers(pos, player):
+            return True
+        return False
+
+    def pins(self, player):
+        """
+        Player's pieces pinned to its king, with the square indexes each of
+        them may still move to: along the pin up to the pinning piece.
+        """
+        pins = {}
+        king_pos = player.king.pos
+        squares = self.squares
+        for ray in Queen.rays[king_pos.index]:
+            diagonal = ray[0].row != king_pos.row \
+                       and ray[0].column != king_pos.column
+            sliders = (Bishop, Queen) if diagonal else (Rook, Queen)
+            pinned = None
+            for i, pos in enumerate(ray):
+                piece = squares[pos.index]
+                if not piece:
+                    continue
+                if not pinned and piece.player is player:
+                    pinned = piece
+                    continue
+                if pinned and piece.player is not player \
+                        and piece.__class__ in sliders:
+                    pins[pinned] = {pos.index for pos in ray[:i + 1]}
+                break
+        return pins
+
+    def check_mask(self, king, checker):
+        """Square indexes on which a piece captures or blocks the checker."""
+        if checker.sliding:
+            for ray in Queen.rays[king.pos.index]:
+                if checker.pos in ray:
+                    return {pos.index
+                            for pos in ray[:ray.index(checker.pos) + 1]}
+        return {checker.pos.index}
+
+    def exposes_king(self, move):
+        """
+        Whether an en passant capture uncovers the own king, as it takes
+        two pieces off the row at once.
+        """
+        squares = self.squares
+        captured = move.captured.pos.index
+        squares[move.old_pos.index] = squares[captured] = None
+        squares[move.new_pos.index] = move.piece
+        exposed = self.in_check(move.player)
+        squares[move.new_pos.index] = None
+        squares[move.old_pos.index] = move.piece
+        squares[captured] = move.captured
+        return exposed
+
+    def in_check(self, player=None):
+        player = player or self.active
+        return self.is_attacked(player.king.pos, self.other(player))
+
+    def is_legal(self, move):
+        """Whether a possible move does not leave the own king in check."""
+        player = self.active
+        self.make_move(move)
+        legal = not self.in_check(player)
+        self.undo_move()
+        return legal
+
+    def legal_moves(self):
+        """
+        Moves of the active player which do not leave its king in check.
+        Checkers and pinned pieces are found once, each piece's moves are
+        then masked by them, no move is made to find out.
+        """
+        checks = self.move_checks()
+        pieces = [self.active.king] if checks[0] else self.active.pieces
+        return list(self.filter_legal(
+            (move for piece in pieces for move in piece.possible_moves()),
+            checks))
+
+    def staged_moves(self, tt_move=None, order=None, quiet=True):
+        """
+        Legal moves of the active player in stages: tt_move (packed) if it
+        is legal here, then captures and promotions, then quiet
+        moves unless not quiet. A stage is only generated once the previous
+        ones are used up, so a cutoff on an early move saves generating the
+        rest. order sorts the moves of a stage if given.
+        """
+        checks = self.move_checks()
+        pieces = [self.active.king] if checks[0] else self.active.pieces
+        if tt_move is not None:
+            move = self.legal_move(tt_move, checks)
+            if move:
+                yield move
+        stages = ['capture_moves', 'quiet_moves'] if quiet \
+                 else ['capture_moves']
+        for stage in stages:
+            # a whole stage is generated before any of it is made, making
+            # moves reorders the pieces
+            moves = [move for move in self.filter_legal(
+                        (move for piece in pieces
+                         for move in getattr(piece, stage)()), checks)
+                     if move.packed != tt_move]
+            yield from order(moves) if order else moves
+
+    def legal_move(self, packed, checks=None):
+        """
+        The legal move of a packed move, None if there is none. Generates
+        only the moves of the piece on its first square.
+        """
+        checks = checks or self.move_checks()
+        piece = self.squares[packed >> 6 & 63]
+        if not piece or piece.player is not self.active \
+                or checks[0] and piece is not self.active.king:
+            return None
+        for move in self.filter_legal(piece.possible_moves(), checks):
+            if move.packed == packed:
+                return move
+        return None
 
+    def see(self, move):
+        """
+        Static exchange evaluation: the material move wins once both sides
+        have recaptured on its square with their least valuable attackers
+        for as long as that pays off, negative for losing captures.
+        """
+        squares = self.squares
+        target = move.new_pos
+        # pieces taken off the board by the exchange, to be put back
+        removed = [move.piece]
+        squares[move.old_pos.index] = None
+        if move.en_passant:
+            removed.append(move.captured)
+            squares[move.captured.pos.index] = None
+
+        gains = [move.captured.value if move.captured else 0]
+        attacker_value = move.piece.value
+        if move.promotion:
+            gains[0] += move.promotion.value - Pawn.value
+            attacker_value = move.promotion.value
+        player = self.other(move.player)
+        while True:
+            # what the side to recapture wins if it does and loses the
+            # recapturing piece in turn
+            gains.append(attacker_value - gains[-1])
+            attackers = list(self.attackers(target, player))
+            if not attackers:
+                break
+            attacker = min(attackers, key=lambda piece: piece.capture_score)
+            removed.append(attacker)
+            squares[attacker.pos.index] = None
+            attacker_value = self.see_king_value \
+                             if attacker.__class__ is King else attacker.value
+            player = self.other(player)
+
+        for piece in removed:
+            squares[piece.pos.index] = piece
+        gains.pop()
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
+    def move_checks(self):
+        """
+        What the active player's moves are masked by: whether it is in
+        double check, the squares which capture or block a single checker
+        (None if not in check) and the pins.
+        """
+        player = self.active
+        king = player.king
+        checkers = list(self.attackers(king.pos, self.opponent))
+        mask = self.check_mask(king, checkers[0]) \
+               if len(checkers) == 1 else None
+        return len(checkers) > 1, mask, self.pins(player)
+
+    def filter_legal(self, moves, checks):
+        """
+        Yields those of the active player's possible moves which are legal
+        under checks, see move_checks.
+        """
+        _, mask, pins = checks
+        king = self.active.king
+        opponent = self.opponent
+        squares = self.squares
+        for move in moves:
+            index = move.new_pos.index
+            if move.piece is king:
+                # the king must not step where it would still be attacked
+                # once it does not block the attacker's ray anymore
+                squares[king.pos.index] = None
+                attacked = self.is_attacked(move.new_pos, opponent)
+                squares[king.pos.index] = king
+                if attacked:
+                    continue
+            elif move.en_passant:
+                if mask and index not in mask \
+                        and move.captured.pos.index not in mask:
+                    continue
+                if self.exposes_king(move):
+                    continue
+            else:
+                if mask and index not in mask:
+                    continue
+                pin = pins.get(move.piece)
+                if pin and index not in pin:
+                    continue
+            yield move
+
+    def move_piece(self, piece, pos):
+        self.squares[piece.pos.index] = None
+        piece.pos = pos
+        self.squares[pos.index] = piece
+
+    def make_move(self, move):
         if isinstance(move, str):
             move = Move(board=self, notation=move)
 
+        self.states.append((self.castling, self.en_passant, self.key,
+                            self.pawn_key, self.psqt, self.halfmove_clock))
+        key = self.key ^ zobrist_keys[zobrist_white]
+        pawn_key = self.pawn_key
+        psqt = self.psqt
+        if self.en_passant \
+                and self.can_capture_en_passant(self.en_passant, self.active):
+            key ^= zobrist_keys[zobrist_en_passant + self.en_passant.column]
+
+        piece = move.piece
+        pawn = piece.__class__ is Pawn
+        promotion = move.promotion
         if move.captured:
+            key ^= move.captured.key
+            if move.captured.__class__ is Pawn:
+                pawn_key ^= move.captured.key
+            psqt -= move.captured.score
             move.captured.leave()
-        if move.promotion:
-            move.promotion['from'].leave()
-            move.promotion['to'].join()
-
-        piece = self[move.old_pos]
-        piece.pos = move.new_pos
-
+        key ^= piece.key
+        if pawn:
+            pawn_key ^= piece.key
+        psqt -= piece.score
+        self.move_piece(piece, move.new_pos)
+        key ^= piece.key
+        psqt += piece.score
+        if pawn and not promotion:
+            pawn_key ^= piece.key
+        if promotion:
+            promoted = promotion(piece.player, self, move.new_pos.column,
+                                 move.new_pos.row)
+            piece.leave()
+            promoted.join()
+            key ^= piece.key ^ promoted.key
+            psqt += promoted.score - piece.score
+        castling = move.castling
+        if castling:
+            rook_from, rook_to = castling
+            rook = self[rook_from]
+            key ^= rook.key
+            psqt -= rook.score
+            self.move_piece(rook, rook_to)
+            key ^= rook.key
+            psqt += rook.score
+
+        if self.castling:
+            lost = self.castling_squares.get(move.old_pos.index, '') + \
+                   self.castling_squares.get(move.new_pos.index, '')
+            if lost:
+                castling = ''
+                for right in self.castling:
+                    if right in lost:
+                        key ^= zobrist_keys[zobrist_castling[right]]
+                    else:
+                        castling += right
+                self.castling = castling
+        self.en_passant = None
+        if isinstance(piece, Pawn) \
+                and abs(move.new_pos.row - move.old_pos.row) == 2:
+            self.en_passant = Position(move.old_pos.column,
+                                       move.old_pos.row + piece.heading)
+            if self.can_capture_en_passant(self.en_passant, self.opponent):
+                key ^= zobrist_keys[zobrist_en_passant
+                                    + self.en_passant.column]
+
+        self.key = key
+        self.pawn_key = pawn_key
+        self.psqt = psqt
+        if move.captured or pawn:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.active is self.black:
+            self.fullmove_number += 1
         self.history.append(move)
-
-        if self.sandbox:
-            self.sandbox.make_move(move.notation)
+        self.active, self.opponent = self.opponent, self.active
 
     def undo_move(self):
         move = self.history.pop()
+        self.active, self.opponent = self.opponent, self.active
 
-        piece = self[move.new_pos]
-        piece.pos = move.old_pos
-
+        piece = move.piece
+        castling = move.castling
+        if castling:
+            rook_from, rook_to = castling
+            self.move_piece(self[rook_to], rook_from)
         if move.promotion:
-            move.promotion['to'].leave()
-            move.promotion['from'].join()
+            # the promoted piece stands where the pawn went
+            self.squares[piece.pos.index].leave()
+            piece.join()
+        self.move_piece(piece, move.old_pos)
         if move.captured:
             move.captured.join()
 
-        if self.sandbox:
-            self.sandbox.undo_move()
-
-    def sync_moves(self, moves):
-        recreate = False
-        if len(moves) <= len(self.history):
-            recreate = True
-        else:
-            for i, move in enumerate(moves[:len(self.history)]):
-                if self.history[i] != move:
-                    log.debug('history diverges at %d: my %s x their %s'
-                              % (i, self.history[i], move))
-                    recreate = True
-                    break
-
-        if recreate:
-            log.debug('recreating board')
-            self.__init__()
+        if self.active is self.black:
+            self.fullmove_number -= 1
+        self.castling, self.en_passant, self.key, self.pawn_key, self.psqt, \
+            self.halfmove_clock = self.states.pop()
 
-        for move in moves[len(self.history):]:
+    def sync_moves(self, moves, fen=None):
+        """
+        Brings the board to the position after moves (notations) played
+        from fen, the initial position by default. Played moves in common
+        with moves are kept, the rest of history is undone; only another
+        fen sets the board up anew.
+        """
+        fen = fen or start_fen
+        if fen != self.initial_fen:
+            log.debug('setting up %s', fen)
+            self.__init__(tt=self.tt, evaluator=self.evaluator,
+                          book=self.book, cache=self.cache, fen=fen)
+
+        common = 0
+        for mine, theirs in zip(self.history, moves):
+            if mine != theirs:
+                log.debug('history diverges at %d: my %s x their %s',
+                          common, mine, theirs)
+                break
+            common += 1
+        while len(self.history) > common:
+            self.undo_move()
+
+        for move in moves[common:]:
             self.make_move(move)
 
-    def bestmove(self):
-        move = sorted(set(self.active.rnd_move() for _ in range(200)),
-                      key=lambda move: move.evaluate_complete())[-1]
+    def perft(self, depth):
+        """Number of leaf nodes of the legal move tree depth plies deep."""
+        if depth == 0:
+            return 1
+        moves = self.legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.undo_move()
+        return nodes
+
+    def divide(self, depth):
+        """Perft node counts below each legal move, by its notation."""
+        nodes = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            nodes[move.notation] = self.perft(depth - 1)
+            self.undo_move()
+        return nodes
+
+    def parse_moves(self, notations):
+        """Moves of the given notations, one after another from here."""
+        moves = []
+        for notation in notations:
+            moves.append(Move(board=self, notation=notation))
+            self.make_move(moves[-1])
+        for _ in moves:
+            self.undo_move()
+        return moves
+
+    def bestmove(self, search=None, threads=1, **limits):
+        """
+        Searches the position and plays the best move found, None if there
+        is no legal move. Takes the limits of Search and the number of
+        worker processes, or a Search to run. A book move is played without
+        searching.
+        """
+        search = search or new_search(self, threads=threads, **limits)
+        if self.book and not search.root_moves:
+            move = self.book.choose(self)
+            if move:
+                log.debug('book move %s', move.notation)
+                self.make_move(move)
+                return move
+        pv = search.run()
+        if not pv:
+            return None
+        move = pv[0]
         self.make_move(move)
         return move
 
     def evaluate(self):
-        sum_eval = lambda player: sum(map(lambda piece: piece.evaluate(),
-                                          player.pieces))
-        return sum_eval(self.active) - 2 * sum_eval(self.opponent)
+        """Score of the position from the active player's point of view."""
+        return self.evaluator.evaluate(self)
 
     def __str__(self):
         board = ''
         for row in range(8, 0, -1):
-            for column in range(1, 9):
-                piece = self[column, row]
+            for piece in self.squares[(row - 1) * 8:row * 8]:
                 board += piece.sign if piece else '.'
             board += '\n'
         return board
 
     def import_pgn(self, pgn):
-        for match in self.pgn_re.finditer(pgn):
-            groups = match.groupdict()
-            if groups['move']:
-                move = Move(board=self, pgn=groups['move'])
-                self.make_move(move)
+        """Plays the moves of PGN movetext, or of a whole game with tags."""
+        for san in Game.parse(pgn).moves:
+            self.make_move(Move(board=self, pgn=san))
+
+
+class Game:
+    """
+    A game read from PGN: its tag pairs, moves in SAN of the main line and
+    result.
+    """
+
+    tag_re = re.compile(r'^\s*\[(?P<name>\w+)\s+"(?P<value>(\\.|[^"])*)"\s*\]')
+    token_re = re.compile(r"""
+        (?P<comment>\{[^}]*\}?|;[^\n]*)
+        | (?P<open>\()
+        | (?P<close>\))
+        | (?P<nag>\$\d+)
+        | (?P<number>\d+\.(\.\.)?)
+        | (?P<result>1-0|0-1|1/2-1/2|\*)
+        | (?P<san>[^\s(){};.$]+)
+        """, re.VERBOSE)
+
+    def __init__(self, headers=None, moves=None, result=None):
+        self.headers = headers or {}
+        self.moves = moves or []
+        self.result = result
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses the text of one game, skipping comments, NAGs, move
+        annotations and variations.
+        """
+        game = cls()
+        movetext = []
+        for line in text.splitlines():
+            m = cls.tag_re.match(line)
+            if m and not movetext:
+                game.headers[m.group('name')] = \
+                    m.group('value').replace('\\"', '"')
+            elif line.strip() and not line.startswith('%'):
+                movetext.append(line)
+
+        variation = 0
+        for token in cls.token_re.finditer('\n'.join(movetext)):
+            kind = token.lastgroup
+            if kind == 'open':
+                variation += 1
+            elif kind == 'close':
+                variation = max(variation - 1, 0)
+            elif variation:
+                continue
+            elif kind == 'san':
+                san = token.group().rstrip('!?')
+                if san.startswith('0-0'):
+                    san = san.replace('0', 'O')
+                game.moves.append(san)
+            elif kind == 'result':
+                game.result = token.group()
+        return game
+
+    def board(self):
+        """Board with the moves of the game played."""
+        board = Board(fen=self.headers.get('FEN'))
+        board.import_pgn(' '.join(self.moves))
+        return board
+
+    def uci_moves(self):
+        return [move.notation for move in self.board().history]
+
+
+def pgn_lines(source):
+    """
+    Lines of a PGN source: a path (read through mmap), a file object,
+    bytes or an mmap.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield from pgn_lines(buf)
+        return
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    readline = source.readline
+    for line in iter(readline, source.read(0)):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        yield line
+
+
+def read_pgn_texts(source):
+    """
+    Yields the text of each game of a PGN source lazily, see pgn_lines for
+    the sources.
+    """
+    game = []
+    in_moves = False
+    in_comment = False
+    for line in pgn_lines(source):
+        stripped = line.strip()
+        if not in_comment:
+            if stripped.startswith('['):
+                if in_moves:
+                    yield ''.join(game)
+                    game = []
+                    in_moves = False
+            elif stripped and not stripped.startswith('%'):
+                in_moves = True
+        game.append(line)
+
+        # a { comment } may span lines and hide a [ at their start
+        for char in line:
+            if in_comment:
+                in_comment = char != '}'
+            elif char == '{':
+                in_comment = True
+            elif char == ';':
+                break
+    if in_moves:
+        yield ''.join(game)
+
+
+def read_pgn(source):
+    """Yields the games of a PGN source lazily, see pgn_lines."""
+    for text in read_pgn_texts(source):
+        yield Game.parse(text)
+
+
+def pgn_game_moves(text):
+    """
+    Tags, moves as notations and result of a game, moves None if the game
+    has an illegal move. The unit of work of read_pgn_parallel.
+    """
+    game = Game.parse(text)
+    try:
+        moves = game.uci_moves()
+    except (ValueError, KeyError, IndexError) as e:
+        log.warning('skipping game %s: %s', game.headers, e)
+        moves = None
+    return game.headers, moves, game.result
+
+
+def read_pgn_parallel(source, processes=None, chunksize=32):
+    """
+    Yields pgn_game_moves of each game of a PGN source in order, resolving
+    the moves across a pool of processes while the source is being read.
+    """
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(pgn_game_moves, read_pgn_texts(source),
+                             chunksize)
+
+
+class Epd:
+    """
+    A position of an EPD test suite: its FEN without the move clocks and
+    operations by their opcodes, each a list of operands, e.g. bm (best
+    moves in SAN), am (moves to avoid) and id.
+    """
+
+    operation_re = re.compile(
+        r'\s*(?P<opcode>\w+)(?P<operands>("[^"]*"|[^;"])*);?')
+    operand_re = re.compile(r'"(?P<quoted>[^"]*)"|(?P<plain>\S+)')
+
+    def __init__(self, fen, operations=None):
+        self.fen = fen
+        self.operations = operations or {}
+
+    @classmethod
+    def parse(cls, line):
+        fields = line.split(None, 4)
+        epd = cls(' '.join(fields[:4]))
+        rest = fields[4] if len(fields) > 4 else ''
+        for m in cls.operation_re.finditer(rest):
+            epd.operations[m.group('opcode')] = [
+                operand.group('quoted') if operand.group('plain') is None
+                else operand.group('plain')
+                for operand in cls.operand_re.finditer(m.group('operands'))
+            ]
+        return epd
+
+    @property
+    def id(self):
+        return self.operations.get('id', [None])[0]
+
+    def moves(self, opcode):
+        """Notations of the moves in SAN of the operation."""
+        board = Board(fen=self.fen)
+        return [Move(board=board, pgn=san.rstrip('!?')).notation
+                for san in self.operations.get(opcode, [])]
+
+
+def read_epd(source):
+    """
+    Yields the positions of an EPD source lazily, see pgn_lines for the
+    sources. Empty lines and lines starting with # are skipped.
+    """
+    for line in pgn_lines(source):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield Epd.parse(line)
+
+
+def analyse_epd(epd, limits):
+    """
+    Searches the position of epd within limits (keyword arguments of
+    Search) in a worker process. The move found solves the position if it
+    is one of the bm and none of the am moves, the time to solution is
+    when the search settled on solving moves (None if it did not).
+    """
+    best, avoid = epd.moves('bm'), epd.moves('am')
+    solves = lambda move: (not best or move in best) and move not in avoid
+    solved_at = None
+
+    def on_info(info):
+        nonlocal solved_at
+        if not solves(search.pv[0].notation):
+            solved_at = None
+        elif solved_at is None:
+            solved_at = search.elapsed
+
+    board = Board(tt=worker_state.get('tt'), fen=epd.fen)
+    board.tt.clear()
+    search = Search(board, on_info=on_info, **limits)
+    pv = search.run()
+    move = pv[0].notation if pv else None
+    return {
+        'id': epd.id,
+        'fen': epd.fen,
+        'bm': best,
+        'am': avoid,
+        'move': move,
+        'solved': bool(best or avoid) and move is not None and solves(move),
+        'time_to_solution': solved_at,
+        'depth': search.depth,
+        'score': search.score,
+        'nodes': search.nodes,
+        'seconds': search.elapsed,
+    }
+
+
+def run_epd(source, processes=None, hash_mb=16, **limits):
+    """
+    Yields analyse_epd of each position of an EPD source in order,
+    analysing them across a pool of processes.
+    """
+    with multiprocessing.Pool(processes, init_worker,
+                              (multiprocessing.Event(), hash_mb)) as pool:
+        yield from pool.imap(functools.partial(analyse_epd, limits=limits),
+                             read_epd(source))
+
+
+def epd_summary(results):
+    """Solve rate, mean time to solution and NPS over analyse_epd results."""
+    solved = [result for result in results if result['solved']]
+    nodes = sum(result['nodes'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    return {
+        'positions': len(results),
+        'solved': len(solved),
+        'solve_rate': len(solved) / len(results) if results else 0,
+        'time_to_solution':
+            sum(result['time_to_solution'] for result in solved) / len(solved)
+            if solved else None,
+        'nodes': nodes,
+        'seconds': seconds,
+        'nps': int(nodes / seconds) if seconds else 0,
+    }
+
+
+class UciEngine:
+    """
+    An engine run as a UCI subprocess, by default this one without a log
+    file. Keeps the nodes
+    and milliseconds of the last info line of every search it is asked
+    for.
+    """
+
+    info_re = re.compile(
+        r'\bnodes (?P<nodes>\d+)\b.*\btime (?P<time>\d+)\b')
+
+    def __init__(self, command=None, options=None):
+        command = command or [sys.executable, os.path.abspath(__file__),
+                              '--log', '']
+        self.proc = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True, bufsize=1)
+        self.nodes = 0
+        self.time = 0
+        self.send('uci')
+        self.read_until('uciok')
+        for name, value in (options or {}).items():
+            self.send('setoption name %s value %s' % (name, value))
+        self.send('ucinewgame')
+        self.send('isready')
+        self.read_until('readyok')
+
+    def send(self, cmd):
+        self.proc.stdin.write(cmd + '\n')
+        self.proc.stdin.flush()
+
+    def read(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise EOFError('engine %s quit' % self.proc.args)
+        return line.strip()
+
+    def read_until(self, prefix):
+        """Reads lines up to the one starting with prefix, returns it."""
+        while True:
+            line = self.read()
+            if line.startswith(prefix):
+                return line
+
+    def bestmove(self, fen, moves, limits):
+        """
+        The move the engine plays after moves from fen, searching within
+        limits given as UCI go arguments, e.g. {'movetime': 100}.
+        """
+        self.send('position fen %s%s' % (
+            fen, ' moves ' + ' '.join(moves) if moves else ''))
+        self.send('go %s' % ' '.join('%s %s' % limit
+                                     for limit in limits.items()))
+        info = None
+        while True:
+            line = self.read()
+            if line.startswith('bestmove'):
+                break
+            m = self.info_re.search(line)
+            if m:
+                info = m
+        if info:
+            self.nodes += int(info.group('nodes'))
+            self.time += int(info.group('time'))
+        return line.split()[1]
+
+    def close(self):
+        try:
+            self.send('quit')
+        except (BrokenPipeError, ValueError):
+            pass
+        self.proc.wait()
+
+
+def game_over(board, seen, max_plies):
+    """
+    Result and reason of a finished game, (None, None) if it goes on. seen
+    counts the occurrences of the positions so far by Board.key.
+    """
+    if not board.legal_moves():
+        if board.in_check():
+            return ('0-1' if board.active is board.white else '1-0'), 'mate'
+        return '1/2-1/2', 'stalemate'
+    if board.halfmove_clock >= 100:
+        return '1/2-1/2', '50 moves'
+    if seen[board.key] >= 3:
+        return '1/2-1/2', 'repetition'
+    if all(piece.__class__ is King for piece in board.pieces):
+        return '1/2-1/2', 'insufficient material'
+    if len(board.history) >= max_plies:
+        return '1/2-1/2', 'adjudicated'
+    return None, None
+
+
+def play_game(white, black, fen, limits, max_plies=400):
+    """
+    Plays a game of the engines white and black, dicts of a name and
+    optionally a command and UCI options, from fen. Each engine searches
+    its moves within limits, see UciEngine.bestmove. Illegal moves lose.
+    """
+    engines = {name: UciEngine(config.get('command'), config.get('options'))
+               for name, config in [('white', white), ('black', black)]}
+    board = Board(fen=fen)
+    fen = board.fen()
+    moves = []
+    seen = {board.key: 1}
+    try:
+        while True:
+            result, reason = game_over(board, seen, max_plies)
+            if result:
+                break
+            color = 'white' if board.active is board.white else 'black'
+            notation = engines[color].bestmove(fen, moves, limits)
+            move = next((move for move in board.legal_moves()
+                         if move.notation == notation), None)
+            if not move:
+                result = '0-1' if color == 'white' else '1-0'
+                reason = 'illegal move %s' % notation
+                break
+            board.make_move(move)
+            moves.append(notation)
+            seen[board.key] = seen.get(board.key, 0) + 1
+    finally:
+        for engine in engines.values():
+            engine.close()
+    return {
+        'white': white['name'],
+        'black': black['name'],
+        'fen': fen,
+        'moves': moves,
+        'result': result,
+        'reason': reason,
+        'nodes': {white['name']: engines['white'].nodes,
+                  black['name']: engines['black'].nodes},
+        'milliseconds': {white['name']: engines['white'].time,
+                         black['name']: engines['black'].time},
+    }
+
+
+def match_score(wins, draws, losses):
+    """Mean score per game and its variance."""
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2
+                + losses * score ** 2) / games
+    return score, variance
+
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_difference(wins, draws, losses):
+    """Elo difference from the first engine's results and its 95% margin."""
+    score, variance = match_score(wins, draws, losses)
+    margin = 1.96 * math.sqrt(variance / (wins + draws + losses))
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+def sprt(wins, draws, losses, elo0=0, elo1=5, alpha=0.05, beta=0.05):
+    """
+    Sequential probability ratio test of elo1 against elo0: the log
+    likelihood ratio of the results, its bounds and 'H1' if elo1 is
+    accepted, 'H0' if elo0 is, None to go on playing. Undecided until
+    there are wins, draws and losses, as in cutechess-cli.
+    """
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    if not (wins and draws and losses):
+        return 0, lower, upper, None
+    games = wins + draws + losses
+    score, variance = match_score(wins, draws, losses)
+    score0, score1 = [1 / (1 + 10 ** (-bound / 400))
+                      for bound in [elo0, elo1]]
+    llr = games * (score1 - score0) * (2 * score - score0 - score1) \
+        / (2 * variance)
+    decision = 'H1' if llr >= upper else 'H0' if llr <= lower else None
+    return llr, lower, upper, decision
+
+
+def run_match(first, second, openings, games, limits, processes=None,
+              max_plies=400, **sprt_args):
+    """
+    Plays up to games games of engine configs first and second (see
+    play_game) across a pool of processes, both colors from each of the
+    openings (FENs) in turn. Yields every game's result with the match
+    stats so far from first's point of view, stopping when the SPRT of
+    sprt_args decides.
+    """
+    tasks = []
+    for i in range(games):
+        fen = openings[i // 2 % len(openings)]
+        white, black = (first, second) if i % 2 == 0 else (second, first)
+        tasks.append((white, black, fen, limits, max_plies))
+
+    start = time.perf_counter()
+    wins = draws = losses = 0
+    nodes = {first['name']: 0, second['name']: 0}
+    milliseconds = dict(nodes)
+    with multiprocessing.Pool(processes) as pool:
+        for game in pool.imap_unordered(play_game_task, tasks):
+            points = {'1-0': 1, '0-1': 0, '1/2-1/2': 0.5}[game['result']]
+            if game['black'] == first['name']:
+                points = 1 - points
+            wins += points == 1
+            draws += points == 0.5
+            losses += points == 0
+            for name in nodes:
+                nodes[name] += game['nodes'][name]
+                milliseconds[name] += game['milliseconds'][name]
+            elo_diff, margin = elo_difference(wins, draws, losses)
+            llr, lower, upper, decision = sprt(wins, draws, losses,
+                                               **sprt_args)
+            seconds = time.perf_counter() - start
+            yield game, {
+                'games': wins + draws + losses,
+                'wins': wins,
+                'draws': draws,
+                'losses': losses,
+                'elo': elo_diff,
+                'elo_margin': margin,
+                'llr': llr,
+                'llr_bounds': (lower, upper),
+                'sprt': decision,
+                'games_per_hour': 3600 * (wins + draws + losses) / seconds,
+                'nps': {name: int(1000 * nodes[name] / milliseconds[name])
+                        if milliseconds[name] else 0 for name in nodes},
+            }
+            if decision:
+                break
+
+
+def play_game_task(args):
+    return play_game(*args)
+
+
+start_fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# standard perft positions with their node counts by depth
+perft_positions = [
+    ('startpos', start_fen,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ('kiwipete',
+     'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603, 193690690]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ('position 4',
+     'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position 4 mirrored',
+     'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position 5',
+     'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487, 89941194]),
+    ('position 6',
+     'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft_suite(depth, positions=perft_positions):
+    """
+    Runs perft on the positions up to depth, returns a result per position
+    and depth with the node count, the expected one (None if unknown) and
+    the speed.
+    """
+    results = []
+    for name, fen, expected in positions:
+        board = Board(fen=fen)
+        expected = expected + [None] * (depth - len(expected))
+        for d in range(1, depth + 1):
+            start = time.perf_counter()
+            nodes = board.perft(d)
+            seconds = time.perf_counter() - start
+            results.append({
+                'name': name,
+                'fen': fen,
+                'depth': d,
+                'nodes': nodes,
+                'expected': expected[d - 1],
+                'ok': expected[d - 1] in [None, nodes],
+                'seconds': seconds,
+                'nps': int(nodes / seconds) if seconds else 0,
+            })
+    return results
+
+
+def bench_threads(depth, threads_counts, positions=perft_positions):
+    """
+    Time to search the positions to depth with each number of worker
+    processes, with the speedup over the first number.
+    """
+    results = []
+    for threads in threads_counts:
+        if threads > 1:
+            # the boards' default evaluator
+            worker_pool(threads, TranspositionTable().size_mb,
+                        PawnStructureEvaluator())
+        seconds = nodes = 0
+        for name, fen, _ in positions:
+            board = Board(fen=fen)
+            search = new_search(board, threads=threads, depth=depth)
+            start = time.perf_counter()
+            search.run()
+            seconds += time.perf_counter() - start
+            nodes += search.nodes
+        results.append({
+            'threads': threads,
+            'depth': depth,
+            'nodes': nodes,
+            'seconds': seconds,
+            'speedup': results[0]['seconds'] / seconds if results else 1,
+        })
+    return results
+
+
+def random_walk(count, positions=perft_positions, seed=0):
+    """
+    Yields a board count times, after a random legal move each time,
+    starting over from the next of the positions after a game ends.
+    """
+    rnd = random.Random(seed)
+    while True:
+        for _, fen, _ in positions:
+            board = Board(fen=fen)
+            for _ in range(100):
+                moves = board.legal_moves()
+                if not moves:
+                    break
+                board.make_move(rnd.choice(moves))
+                yield board
+                count -= 1
+                if not count:
+                    return
+
+
+def bench_eval(count, positions=perft_positions):
+    """
+    Time to evaluate count positions one by one with Board.evaluate and at
+    once with BatchEvaluator, for the material and the mobility terms, with
+    the number of scores which differ.
+    """
+    evaluators = [('material', MaterialEvaluator(), False),
+                  ('mobility', MobilityEvaluator(), True)]
+    expected = [[] for _ in evaluators]
+    scalar_seconds = [0] * len(evaluators)
+    squares = np.zeros((count, 64), dtype=np.int8)
+    white = np.zeros(count, dtype=bool)
+    for i, board in enumerate(random_walk(count, positions)):
+        for j, (_, evaluator, _) in enumerate(evaluators):
+            start = time.perf_counter()
+            expected[j].append(evaluator.evaluate(board))
+            scalar_seconds[j] += time.perf_counter() - start
+        squares[i], white[i] = [array[0] for array
+                                in BatchEvaluator.encode([board])]
+
+    results = []
+    for j, (name, _, mobility) in enumerate(evaluators):
+        batch = BatchEvaluator(mobility)
+        start = time.perf_counter()
+        scores = batch.evaluate(squares, white)
+        batch_seconds = time.perf_counter() - start
+        results.append({
+            'evaluator': name,
+            'positions': count,
+            'scalar_seconds': scalar_seconds[j],
+            'batch_seconds': batch_seconds,
+            'speedup': scalar_seconds[j] / batch_seconds
+                       if batch_seconds else 0,
+            'mismatches': int((scores != expected[j]).sum()),
+        })
+    return results
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump({'time': time.time(), 'results': results}, f, indent=2)
+
+
+class SearchThread(threading.Thread):
+    """
+    Runs Board.bestmove in the background and reports the move found and
+    the reply expected to it (None if unknown) to on_bestmove, so the UCI
+    loop keeps reading commands meanwhile. An infinite search reports only
+    after stop(), a ponder search after ponderhit() or stop().
+    """
+
+    def __init__(self, board, on_bestmove, infinite=False, ponder=False,
+                 threads=1, **limits):
+        super().__init__(daemon=True)
+        self.board = board
+        self.on_bestmove = on_bestmove
+        self.infinite = infinite
+        self.search = new_search(board, threads=threads, infinite=infinite,
+                                 ponder=ponder, **limits)
+        self.released = threading.Event()
+        if not infinite and not ponder:
+            self.released.set()
+
+    @property
+    def waiting(self):
+        """Whether the search reports only after stop() or ponderhit()."""
+        return not self.released.is_set()
+
+    def run(self):
+        move = self.board.bestmove(search=self.search)
+        pv = self.search.pv
+        ponder = pv[1] if move and len(pv) > 1 and pv[0] == move else None
+        self.released.wait()
+        self.on_bestmove(move, ponder)
+
+    def ponderhit(self):
+        """Goes on searching, now as if the search started normally."""
+        self.search.ponderhit()
+        if not self.infinite:
+            self.released.set()
+
+    def stop(self):
+        """Stops the search and waits for the move to be reported."""
+        self.search.stop()
+        self.released.set()
+        self.join()
+
+
+go_int_args = ['wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime',
+               'depth', 'nodes']
+
+
+uci_move_re = re.compile(r'^[a-h][1-8][a-h][1-8][qrbn]?$')
+
+
+def parse_position(cmd):
+    """FEN (None for startpos) and moves of UCI position."""
+    args = cmd.split()
+    end = args.index('moves') if 'moves' in args else len(args)
+    fen = ' '.join(args[2:end]) if args[1] == 'fen' else None
+    return fen, args[end + 1:]
+
+
+def parse_go(cmd):
+    """UCI go arguments as keyword arguments of Search."""
+    args = cmd.split()[1:]
+    limits = {}
+    for i, arg in enumerate(args):
+        if arg in go_int_args and i + 1 < len(args):
+            limits[arg] = int(args[i + 1])
+        elif arg in ['infinite', 'ponder']:
+            limits[arg] = True
+        elif arg == 'searchmoves':
+            limits['root_moves'] = list(itertools.takewhile(
+                lambda arg: uci_move_re.match(arg), args[i + 1:]))
+    return limits
+
+
+# info lines of the search thread and replies of the UCI loop are sent
+# whole, one at a time
+send_lock = threading.Lock()
+
+
+# evaluators by the names of the UCI option Evaluator, the option
+# PawnStructure adds the pawn structure to them
+evaluators = {
+    'Material': MaterialEvaluator,
+    'Mobility': MobilityEvaluator,
+}
 
 
 def send(msg):  # pragma: no cover
-    log.debug('sending: %s' % msg)
-    print(msg)
+    log.debug('sending: %s', msg)
+    with send_lock:
+        print(msg, flush=True)
+
+def send_bestmove(move, ponder=None):  # pragma: no cover
+    send('bestmove %s%s' % (move.notation if move else '0000',
+                            ' ponder %s' % ponder.notation if ponder else ''))
 
 def main():  # pragma: no cover
+    board = Board()
+    thread = None
+    threads = 1
+    multipv = 1
+    evaluator = 'Material'
+    pawn_structure = True
+    own_book = False
+    book_file = ''
+    profile_file = None
     while True:
-        cmd = input()
-        log.debug('received: %s' % cmd)
+        try:
+            cmd = input()
+        except EOFError:
+            # the GUI went away
+            cmd = 'quit'
+        log.debug('received: %s', cmd)
+
+        if thread and cmd not in ['isready', 'uci', 'ponderhit']:
+            # anything else but a ping waits for the search to finish
+            if cmd in ['stop', 'quit'] or thread.waiting:
+                thread.stop()
+            thread.join()
+            thread = None
 
         if cmd == 'quit':
+            if board.cache:
+                board.cache.close()
             break
         elif cmd == 'uci':
             send('id name og-engine')
             send('id author og')
+            send('option name Hash type spin default %d min 1 max 4096'
+                 % board.tt.size_mb)
+            send('option name Threads type spin default 1 min 1 max %d'
+                 % multiprocessing.cpu_count())
+            send('option name MultiPV type spin default 1 min 1 max 256')
+            send('option name Evaluator type combo default Material %s'
+                 % ' '.join('var %s' % name for name in evaluators))
+            send('option name PawnStructure type check default true')
+            send('option name Ponder type check default false')
+            send('option name OwnBook type check default false')
+            send('option name BookFile type string default <empty>')
+            send('option name ProfileFile type string default <empty>')
+            send('option name AnalysisCache type string default <empty>')
             send('uciok')
         elif cmd == 'isready':
             send('readyok')
+        elif cmd == 'ponderhit':
+            # the opponent played the expected move, the pondering search
+            # continues on the clock
+            if thread:
+                thread.ponderhit()
+        elif cmd.startswith('setoption '):
+            m = re.match(r'setoption name (?P<name>.+?)( value (?P<value>.*))?$',
+                         cmd)
+            if m and m.group('name') in ['Hash', 'Threads']:
+                if m.group('name') == 'Hash':
+                    board.tt.resize(int(m.group('value')))
+                else:
+                    threads = int(m.group('value'))
+            elif m and m.group('name') == 'MultiPV':
+                multipv = int(m.group('value'))
+            elif m and m.group('name') in ['Evaluator', 'PawnStructure']:
+                if m.group('name') == 'PawnStructure':
+                    pawn_structure = m.group('value') == 'true'
+                elif m.group('value') in evaluators:
+                    evaluator = m.group('value')
+                board.evaluator = evaluators[evaluator]()
+                if pawn_structure:
+                    board.evaluator = PawnStructureEvaluator(board.evaluator)
+            elif m and m.group('name') in ['OwnBook', 'BookFile']:
+                if m.group('name') == 'OwnBook':
+                    own_book = m.group('value') == 'true'
+                else:
+                    book_file = m.group('value') or ''
+                    if book_file == '<empty>':
+                        book_file = ''
+                if board.book:
+                    board.book.close()
+                board.book = None
+                if own_book and book_file:
+                    try:
+                        board.book = OpeningBook(book_file)
+                    except OSError as e:
+                        send('info string cannot open book: %s' % e)
+            elif m and m.group('name') == 'ProfileFile':
+                # cProfile reports of the following searches go there
+                profile_file = m.group('value')
+                if profile_file in [None, '', '<empty>']:
+                    profile_file = None
+            elif m and m.group('name') == 'AnalysisCache':
+                # a database of deep results kept across runs
+                if board.cache:
+                    board.cache.close()
+                board.cache = None
+                if m.group('value') not in [None, '', '<empty>']:
+                    board.cache = AnalysisCache(m.group('value'))
+            if m and m.group('name') in ['Hash', 'Threads', 'Evaluator',
+                                         'PawnStructure'] and threads > 1:
+                # the workers start now rather than on the search's clock
+                worker_pool(threads, board.tt.size_mb, board.evaluator)
         elif cmd == 'ucinewgame':
-            board = Board()
-        elif cmd.startswith('position startpos'):
-            moves = cmd.split()[3:]
-            board.sync_moves(moves)
-        elif cmd.startswith('go '):
-            send('bestmove %s' % board.bestmove().notation)
+            board.tt.clear()
+            board = Board(tt=board.tt, evaluator=board.evaluator,
+                          book=board.book, cache=board.cache)
+        elif cmd.startswith('position '):
+            fen, moves = parse_position(cmd)
+            board.sync_moves(moves, fen)
+        elif cmd.startswith('go perft'):
+            depth = int(cmd.split()[2])
+            start = time.perf_counter()
+            divide = board.divide(depth)
+            seconds = time.perf_counter() - start
+            for notation, nodes in sorted(divide.items()):
+                send('%s: %d' % (notation, nodes))
+            nodes = sum(divide.values())
+            send('info nodes %d time %d nps %d'
+                 % (nodes, 1000 * seconds, nodes / seconds if seconds else 0))
+            send('')
+            send('Nodes searched: %d' % nodes)
+        elif cmd.startswith('go'):
+            thread = SearchThread(board, send_bestmove, threads=threads,
+                                  multipv=multipv, on_info=send,
+                                  profile=profile_file, **parse_go(cmd))
+            thread.start()
+
+def cli(args):  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description='UCI chess engine, speaks UCI when run with no command.')
+    parser.add_argument('--log', default='og-engine.log',
+                        help='debug log file, none if empty')
+    commands = parser.add_subparsers(dest='command')
+
+    perft = commands.add_parser(
+        'perft', help='count move generator nodes of standard positions')
+    perft.add_argument('depth', type=int, nargs='?', default=3)
+    perft.add_argument('--fen', help='a position instead of the standard ones')
+    perft.add_argument('--divide', action='store_true',
+                       help='print the nodes below each root move')
+    perft.add_argument('--output', help='save the results as JSON')
+
+    smp = commands.add_parser(
+        'smp', help='time to depth with more worker processes')
+    smp.add_argument('depth', type=int, nargs='?', default=4)
+    smp.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    smp.add_argument('--output', help='save the results as JSON')
+
+    pgn = commands.add_parser(
+        'pgn', help='read the games of a PGN file, report games per second')
+    pgn.add_argument('file')
+    pgn.add_argument('--processes', type=int,
+                     help='worker processes resolving the moves, '
+                          'as many as CPUs by default')
+    pgn.add_argument('--output', help='save the games as JSON')
+
+    epd = commands.add_parser(
+        'epd', help='analyse the positions of an EPD test suite, '
+                    'check the best moves')
+    epd.add_argument('file')
+    epd.add_argument('--movetime', type=int,
+                     help='milliseconds per position')
+    epd.add_argument('--nodes', type=int, help='nodes per position')
+    epd.add_argument('--depth', type=int, help='depth per position')
+    epd.add_argument('--processes', type=int,
+                     help='positions analysed at once, '
+                          'as many as CPUs by default')
+    epd.add_argument('--output', help='save the results as JSON')
+
+    match = commands.add_parser(
+        'match', help='play engines against each other, test for an Elo '
+                      'gain with SPRT')
+    match.add_argument('--engine', action='append', default=[],
+                       metavar='NAME[=COMMAND]',
+                       help='an engine, twice, this one if no command')
+    match.add_argument('--option', action='append', default=[],
+                       metavar='NAME:OPTION=VALUE',
+                       help='a UCI option of the engine of that name')
+    match.add_argument('--openings',
+                       help='EPD or FEN file of opening positions, '
+                            'each played with both colors')
+    match.add_argument('--games', type=int, default=1000,
+                       help='games at most')
+    match.add_argument('--movetime', type=int, help='milliseconds per move')
+    match.add_argument('--nodes', type=int, help='nodes per move')
+    match.add_argument('--depth', type=int, help='depth per move')
+    match.add_argument('--elo0', type=float, default=0)
+    match.add_argument('--elo1', type=float, default=5)
+    match.add_argument('--alpha', type=float, default=0.05)
+    match.add_argument('--beta', type=float, default=0.05)
+    match.add_argument('--processes', type=int,
+                       help='games played at once, as many as CPUs by '
+                            'default')
+    match.add_argument('--output', help='save the games as JSON')
+
+    evaluation = commands.add_parser(
+        'eval', help='evaluate positions one by one and in a NumPy batch')
+    evaluation.add_argument('positions', type=int, nargs='?', default=10000)
+    evaluation.add_argument('--output', help='save the results as JSON')
+
+    args = parser.parse_args(args)
+    if args.log:
+        log.addHandler(logging.FileHandler(args.log))
+        log.setLevel(logging.DEBUG)
+
+    if args.command == 'perft':
+        if args.divide:
+            board = Board(fen=args.fen or start_fen)
+            for notation, nodes in sorted(board.divide(args.depth).items()):
+                print('%s: %d' % (notation, nodes))
+            return
+        positions = perft_positions
+        if args.fen:
+            positions = [('fen', args.fen, [])]
+        results = perft_suite(args.depth, positions)
+        for result in results:
+            print('%(name)-20s depth %(depth)d %(nodes)10d nodes '
+                  '%(nps)8d nps %(ok)s' % result)
+        nodes = sum(result['nodes'] for result in results)
+        seconds = sum(result['seconds'] for result in results)
+        print('total %d nodes in %.2f s, %d nps'
+              % (nodes, seconds, nodes / seconds if seconds else 0))
+        if args.output:
+            save_results(results, args.output)
+        if not all(result['ok'] for result in results):
+            sys.exit(1)
+    elif args.command == 'smp':
+        results = bench_threads(args.depth, args.threads)
+        for result in results:
+            print('%(threads)2d threads depth %(depth)d %(nodes)8d nodes '
+                  '%(seconds)7.2f s speedup %(speedup).2f' % result)
+        close_worker_pools()
+        if args.output:
+            save_results(results, args.output)
+    elif args.command == 'pgn':
+        start = time.perf_counter()
+        # the games are kept only to be saved, a large file streams through
+        games = []
+        count = skipped = plies = 0
+        for headers, moves, result in read_pgn_parallel(args.file,
+                                                         args.processes):
+            count += 1
+            if moves is None:
+                skipped += 1
+            else:
+                plies += len(moves)
+            if args.output:
+                games.append({'headers': headers, 'moves': moves,
+                              'result': result})
+        seconds = time.perf_counter() - start
+        print('%d games (%d skipped), %d plies in %.2f s, %.1f games/s'
+              % (count, skipped, plies, seconds,
+                 count / seconds if seconds else 0))
+        if args.output:
+            save_results(games, args.output)
+    elif args.command == 'epd':
+        limits = {name: getattr(args, name)
+                  for name in ['movetime', 'nodes', 'depth']
+                  if getattr(args, name)}
+        start = time.perf_counter()
+        results = []
+        for result in run_epd(args.file, args.processes, **limits):
+            results.append(result)
+            print('%-20s %-5s %s depth %d %8d nodes %s' % (
+                result['id'] or result['fen'], result['move'],
+                'ok' if result['solved'] else '--', result['depth'],
+                result['nodes'],
+                '%.2f s' % result['time_to_solution']
+                if result['time_to_solution'] is not None else ''))
+        seconds = time.perf_counter() - start
+        summary = epd_summary(results)
+        print('solved %d of %d (%.0f %%), %s to solution, %d nps, '
+              '%.2f s search, %.2f s wall' % (
+                  summary['solved'], summary['positions'],
+                  100 * summary['solve_rate'],
+                  '%.2f s' % summary['time_to_solution']
+                  if summary['time_to_solution'] is not None else 'no time',
+                  summary['nps'], summary['seconds'], seconds))
+        if args.output:
+            save_results({'summary': summary, 'positions': results},
+                         args.output)
+    elif args.command == 'match':
+        engines = []
+        for spec in (args.engine + ['base', 'test'])[:2]:
+            name, _, command = spec.partition('=')
+            engines.append({'name': name, 'options': {},
+                            'command': command.split() or None})
+        if engines[0]['name'] == engines[1]['name']:
+            parser.error('the engines need different names')
+        for spec in args.option:
+            name, _, option = spec.partition(':')
+            option, _, value = option.partition('=')
+            for engine in engines:
+                if engine['name'] == name:
+                    engine['options'][option] = value
+        openings = [epd.fen for epd in read_epd(args.openings)] \
+            if args.openings else [start_fen]
+        limits = {name: getattr(args, name)
+                  for name in ['movetime', 'nodes', 'depth']
+                  if getattr(args, name)} or {'movetime': 100}
+        games = []
+        for game, stats in run_match(
+                engines[0], engines[1], openings, args.games, limits,
+                args.processes, elo0=args.elo0, elo1=args.elo1,
+                alpha=args.alpha, beta=args.beta):
+            games.append(game)
+            print('%s - %s %s (%s), %+d %+d =%d, Elo %+.1f +- %.1f, '
+                  'LLR %.2f [%.2f, %.2f], %.0f games/h, nps %s' % (
+                      game['white'], game['black'], game['result'],
+                      game['reason'], stats['wins'], -stats['losses'],
+                      stats['draws'], stats['elo'], stats['elo_margin'],
+                      stats['llr'], *stats['llr_bounds'],
+                      stats['games_per_hour'],
+                      ' '.join('%s %d' % item
+                               for item in stats['nps'].items())))
+        if games:
+            print('SPRT: %s' % {'H1': 'elo1 accepted', 'H0': 'elo0 accepted',
+                                None: 'inconclusive'}[stats['sprt']])
+        if args.output:
+            save_results({'engines': engines, 'games': games}, args.output)
+    elif args.command == 'eval':
+        results = bench_eval(args.positions)
+        for result in results:
+            print('%(evaluator)-8s %(positions)d positions scalar '
+                  '%(scalar_seconds).3f s batch %(batch_seconds).3f s '
+                  'speedup %(speedup).1f mismatches %(mismatches)d' % result)
+        if args.output:
+            save_results(results, args.output)
+        if any(result['mismatches'] for result in results):
+            sys.exit(1)
+    else:
+        log.debug('start')
+        main()
+        log.debug('end')
 
 if __name__ == '__main__':  # pragma: no cover
-    log.addHandler(logging.FileHandler('og-engine.log'))
-    log.setLevel(logging.DEBUG)
-
-    log.debug('start')
-    main()
-    log.debug('end')
+    cli(sys.argv[1:])
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
 from subprocess import Popen, PIPE
-import unittest
+import io
+import os
 import re
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
 import og_engine
 
@@ -31,6 +37,160 @@ class EngineTestCase(unittest.TestCase):
         self.board.make_move('e2e3')
         self.assertPossibleMoves(queen, ['d1e2', 'd1f3', 'd1g4', 'd1h5'])
 
+    def test_rays(self):
+        a1, d4 = og_engine.Position('a1').index, og_engine.Position('d4').index
+        self.assertEqual(len(og_engine.Knight.rays[a1]), 2)
+        self.assertEqual(len(og_engine.Knight.rays[d4]), 8)
+        self.assertEqual(len(og_engine.King.rays[a1]), 3)
+        self.assertEqual([len(ray) for ray in og_engine.Rook.rays[a1]], [7, 7])
+        self.assertEqual(sum(map(len, og_engine.Queen.rays[d4])), 27)
+
+        self.board.sync_moves(['a2a4', 'h7h5', 'a1a3', 'h5h4'])
+        self.assertPossibleMoves(self.board['a3'], [
+            'a3a2', 'a3a1', 'a3b3', 'a3c3', 'a3d3', 'a3e3', 'a3f3', 'a3g3',
+            'a3h3',
+        ])
+        self.assertPossibleMoves(self.board['b1'], ['b1c3'])
+        self.assertIn(self.board['a3'], self.board.attackers(
+            og_engine.Position('h3'), self.board.white))
+        self.assertNotIn(self.board['a3'], self.board.attackers(
+            og_engine.Position('a5'), self.board.white))
+        self.assertTrue(self.board.is_attacked(og_engine.Position('g3'),
+                                               self.board.black))
+
+    def test_fen(self):
+        board = og_engine.Board(fen='r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/'
+                                    '2N2Q1p/PPPBBPPP/R3K2R b Kq e3 0 1')
+        self.assertEqual(board.active, board.black)
+        self.assertEqual(board.castling, 'Kq')
+        self.assertEqual(str(board.en_passant), 'e3')
+        self.assertEqual(board['a8'].sign, '♜')
+        self.assertEqual(board['e5'].sign, '♘')
+        self.assertEqual(board.black.king.pos, og_engine.Position('e8'))
+        self.assertEqual(len(board.white.pieces), 16)
+        self.assertEqual(board.key, board.compute_key())
+
+        board = og_engine.Board(fen=og_engine.start_fen)
+        self.assertEqual(str(board), str(self.board))
+        self.assertEqual(board.key, self.board.key)
+
+    def test_fen_export(self):
+        self.assertEqual(self.board.fen(), og_engine.start_fen)
+        fen = ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R '
+               'b Kq e3 7 23')
+        self.assertEqual(og_engine.Board(fen=fen).fen(), fen)
+        # the clocks may be left out
+        board = og_engine.Board(fen='8/8/8/8/8/8/8/K6k w - -')
+        self.assertEqual(board.fen(), '8/8/8/8/8/8/8/K6k w - - 0 1')
+
+        for move, placement, rest in [
+            ('g1f3', 'rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R',
+             'b KQkq - 1 1'),
+            ('g8f6', 'rnbqkb1r/pppppppp/5n2/8/8/5N2/PPPPPPPP/RNBQKB1R',
+             'w KQkq - 2 2'),
+            ('e2e4', 'rnbqkb1r/pppppppp/5n2/8/4P3/5N2/PPPP1PPP/RNBQKB1R',
+             'b KQkq e3 0 2'),
+            ('f6e4', 'rnbqkb1r/pppppppp/8/8/4n3/5N2/PPPP1PPP/RNBQKB1R',
+             'w KQkq - 0 3'),
+        ]:
+            self.board.make_move(move)
+            self.assertEqual(self.board.fen(), placement + ' ' + rest)
+        for _ in range(4):
+            self.board.undo_move()
+        self.assertEqual(self.board.fen(), og_engine.start_fen)
+
+    def assertLegalMoves(self, fen, moves):
+        board = og_engine.Board(fen=fen)
+        self.assertEqual(set(m.notation for m in board.legal_moves()),
+                         set(moves))
+        for move in board.legal_moves():
+            self.assertTrue(board.is_legal(move))
+
+    def test_legal_moves(self):
+        # pinned bishop cannot move, pinned rook only along the pin
+        self.assertLegalMoves('4r2k/8/8/8/8/8/4B3/4K3 w - - 0 1', [
+            'e1d1', 'e1f1', 'e1d2', 'e1f2'])
+        self.assertLegalMoves('4r2k/8/8/8/8/8/4R3/4K3 w - - 0 1', [
+            'e1d1', 'e1f1', 'e1d2', 'e1f2',
+            'e2e3', 'e2e4', 'e2e5', 'e2e6', 'e2e7', 'e2e8'])
+        # check by a knight: take it or step away
+        self.assertLegalMoves('7k/8/8/8/8/3n4/8/R2QK3 w - - 0 1', [
+            'e1d2', 'e1e2', 'e1f1', 'd1d3'])
+        # double check leaves only king moves
+        self.assertLegalMoves('4r2k/8/8/8/8/5n2/8/Q3K3 w - - 0 1', [
+            'e1d1', 'e1f2', 'e1f1'])
+        # the king cannot step back along a checking ray
+        self.assertLegalMoves('7k/8/8/8/8/8/8/r3K3 w - - 0 1', [
+            'e1d2', 'e1e2', 'e1f2'])
+        # en passant taking both pawns off the king's row
+        self.assertLegalMoves('8/8/8/KPp4r/8/8/8/7k w - c6 0 1', [
+            'a5a4', 'a5a6', 'a5b6', 'b5b6'])
+        # castling not out of, through or into check
+        for fen, castlings in [
+            ('r3k2r/8/8/8/8/8/8/5R1K b kq - 0 1', ['e8c8']),
+            ('r3k2r/8/8/8/8/8/8/2R4K b kq - 0 1', ['e8g8']),
+            ('r3k2r/8/8/8/8/8/8/1R5K b kq - 0 1', ['e8c8', 'e8g8']),
+            ('r3k2r/8/8/8/8/8/8/4R2K b kq - 0 1', []),
+        ]:
+            board = og_engine.Board(fen=fen)
+            self.assertEqual(sorted(m.notation for m in board.legal_moves()
+                                    if m.castling), castlings)
+
+    def test_staged_moves(self):
+        for _, fen, _ in og_engine.perft_positions:
+            board = og_engine.Board(fen=fen)
+            staged = [m.notation for m in board.staged_moves()]
+            self.assertEqual(sorted(staged),
+                             sorted(m.notation for m in board.legal_moves()))
+            captures = [m.notation for m in board.legal_moves()
+                        if m.captured or m.promotion]
+            self.assertEqual(set(staged[:len(captures)]), set(captures))
+
+        # the hash move first and only once, unless it is not legal here
+        self.board.sync_moves(['e2e4', 'd7d5'])
+        staged = lambda notation: [m.notation for m in self.board.staged_moves(
+            og_engine.pack_move(og_engine.Position(notation[:2]).index,
+                                og_engine.Position(notation[2:]).index))]
+        moves = staged('g1f3')
+        self.assertEqual(moves[:2], ['g1f3', 'e4d5'])
+        self.assertEqual(moves.count('g1f3'), 1)
+        moves = staged('e1f2')
+        self.assertEqual(moves[0], 'e4d5')
+        self.assertNotIn('e1f2', moves)
+        self.assertEqual(staged('d8d5')[0], 'e4d5')
+
+        # quiet moves are not generated while captures are still tried
+        generated = []
+        quiet_moves = lambda piece: generated.append(piece) or iter(())
+        patch = lambda piece_class: mock.patch.object(
+            piece_class, 'quiet_moves', quiet_moves)
+        with patch(og_engine.Piece), patch(og_engine.King), \
+                patch(og_engine.Pawn):
+            moves = self.board.staged_moves()
+            self.assertEqual(next(moves).notation, 'e4d5')
+            self.assertEqual(generated, [])
+            self.assertEqual(list(moves), [])
+        self.assertEqual(len(generated), 16)
+
+    def test_perft(self):
+        self.assertEqual(self.board.perft(3), 8902)
+        divide = self.board.divide(2)
+        self.assertEqual(len(divide), 20)
+        self.assertEqual(divide['e2e4'], 20)
+        self.assertEqual(sum(divide.values()), 400)
+        self.assertEqual(self.board.history, [])
+
+    def test_perft_suite(self):
+        results = og_engine.perft_suite(2)
+        self.assertEqual(len(results), 2 * len(og_engine.perft_positions))
+        for result in results:
+            self.assertTrue(result['ok'], result)
+
+        results = og_engine.perft_suite(2, [('no counts', og_engine.start_fen,
+                                             [20])])
+        self.assertEqual([r['expected'] for r in results], [20, None])
+        self.assertTrue(all(r['ok'] for r in results))
+
     def test_history(self):
         history = lambda: list(map(lambda m: m.notation, self.board.history))
         self.board.make_move('d2d4')
@@ -65,15 +225,649 @@ class EngineTestCase(unittest.TestCase):
             7
         )
 
+    def test_squares(self):
+        self.assertEqual(self.board[4], self.board['e1'])
+        self.assertEqual(self.board[5, 1], self.board['e1'])
+        self.assertFalse(self.board['e9'])
+        self.assertFalse(self.board[0, 1])
+
+        self.board.sync_moves(['g1h3', 'g7g5', 'h3g5'])
+        self.board.undo_move()
+        self.board.undo_move()
+        for piece in self.board.pieces:
+            self.assertIs(self.board[piece.pos], piece)
+        self.assertEqual(sum(1 for p in self.board.squares if p), 32)
+        self.assertEqual(self.board['h3'].sign, '♘')
+        self.assertFalse(self.board['g5'])
+
+    def test_packed_move(self):
+        move = og_engine.Move(board=self.board, notation='g1f3')
+        # as in Polyglot books
+        self.assertEqual(move.packed, 0x195)
+        self.assertEqual(move.packed, og_engine.pack_move(6, 21))
+        self.assertEqual(hash(move), move.packed)
+        self.assertEqual(move, og_engine.Move(board=self.board,
+                                              notation='g1f3'))
+        self.assertEqual(move, 'g1f3')
+        self.assertEqual(len({move, self.board.legal_moves()[0]} |
+                             set(self.board.legal_moves())), 20)
+
+        board = og_engine.Board(fen='4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        packed = {m.notation: m.packed for m in board.legal_moves()}
+        self.assertEqual(packed['b7b8q'], 0x4c79)
+        self.assertEqual(packed['b7b8n'], 0x1c79)
+        self.assertEqual(board.legal_move(packed['b7b8r']).notation, 'b7b8r')
+        self.assertIsNone(board.legal_move(og_engine.pack_move(4, 20)))
+
+        # the squares and the rook's castling squares are decoded
+        board = og_engine.Board(fen='4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1')
+        move = og_engine.Move(board=board, notation='e1c1')
+        self.assertEqual((move.old_pos, move.new_pos),
+                         (og_engine.Position('e1'), og_engine.Position('c1')))
+        self.assertIsNone(move.promotion)
+        self.assertEqual(move.castling, (og_engine.Position('a1'),
+                                         og_engine.Position('d1')))
+        self.assertIsNone(og_engine.Move(board=board,
+                                         notation='e1d1').castling)
+
+        # no per instance dictionaries
+        for obj in [move, move.new_pos, move.piece, board['b7'],
+                    og_engine.Direction(1, 2)]:
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+
     def test_promotion(self):
-        # TODO set a board and test promotion being both understood
-        # and proposed; it also has to be undoable
-        pass
+        self.board.sync_moves(['h2h4', 'g7g5', 'h4g5', 'h7h6', 'g5h6', 'a7a6',
+                               'h6h7', 'a6a5'])
+        pawn = self.board['h7']
+        self.assertPossibleMoves(pawn, ['h7g8q', 'h7g8r', 'h7g8b', 'h7g8n'])
+
+        self.board.make_move('h7g8n')
+        self.assertEqual(self.board['g8'].sign, '♘')
+        self.assertEqual(self.board.history[-1].notation, 'h7g8n')
+        self.assertNotIn(pawn, self.board.white.pieces)
+
+        self.board.undo_move()
+        self.assertIs(self.board['h7'], pawn)
+        self.assertEqual(self.board['g8'].sign, '♞')
+        self.assertEqual(len(self.board.white.pieces), 16)
+
+    def test_castling(self):
+        self.board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4', 'g8f6'])
+        king = self.board['e1']
+        self.assertPossibleMoves(king, ['e1e2', 'e1f1', 'e1g1'])
+
+        self.board.make_move('e1g1')
+        self.assertEqual(self.board['g1'].sign, '♔')
+        self.assertEqual(self.board['f1'].sign, '♖')
+        self.assertFalse(self.board['h1'])
+        self.assertEqual(self.board.castling, 'kq')
+
+        self.board.undo_move()
+        self.assertEqual(self.board['e1'].sign, '♔')
+        self.assertEqual(self.board['h1'].sign, '♖')
+        self.assertFalse(self.board['f1'])
+        self.assertEqual(self.board.castling, 'KQkq')
+
+    def test_en_passant(self):
+        self.board.sync_moves(['e2e4', 'a7a6', 'e4e5', 'd7d5'])
+        self.assertEqual(str(self.board.en_passant), 'd6')
+        self.assertPossibleMoves(self.board['e5'], ['e5e6', 'e5d6'])
+
+        self.board.make_move('e5d6')
+        self.assertEqual(str(self.board.history[-1].captured), '<♟ on d5>')
+        self.assertFalse(self.board['d5'])
+        self.assertIsNone(self.board.en_passant)
+
+        self.board.undo_move()
+        self.assertEqual(self.board['d5'].sign, '♟')
+        self.assertEqual(str(self.board.en_passant), 'd6')
+
+    def test_zobrist(self):
+        start = self.board.key
+        moves = ['e2e4', 'd7d5', 'e4e5', 'f7f5', 'e5f6', 'g8h6', 'f6g7',
+                 'b8c6', 'g7h8q', 'c8e6', 'g1f3', 'd8d7', 'f1e2', 'e8c8',
+                 'e1g1']
+        keys = []
+        for move in moves:
+            self.board.make_move(move)
+            self.assertEqual(self.board.key, self.board.compute_key())
+            keys.append(self.board.key)
+        self.assertEqual(len(set(keys)), len(keys))
+        for key in reversed(keys):
+            self.assertEqual(self.board.key, key)
+            self.board.undo_move()
+        self.assertEqual(self.board.key, start)
+
+    def test_zobrist_transposition(self):
+        self.board.sync_moves(['g1f3', 'g8f6', 'b1c3'])
+        other = og_engine.Board()
+        other.sync_moves(['b1c3', 'g8f6', 'g1f3'])
+        self.assertEqual(self.board.key, other.key)
+
+        # the same pieces, but en passant is possible only in one of them
+        self.board.sync_moves(['e2e4', 'a7a6', 'e4e5', 'a6a5', 'g1f3', 'd7d5'])
+        other.sync_moves(['e2e4', 'd7d6', 'e4e5', 'a7a5', 'g1f3', 'd6d5'])
+        self.assertEqual(str(self.board), str(other))
+        self.assertNotEqual(self.board.key, other.key)
+        # en passant not possible is not hashed
+        self.board.sync_moves(['e2e4', 'g8f6', 'g1f3', 'f6g8', 'f3g1'])
+        other.sync_moves(['g1f3', 'g8f6', 'f3g1', 'f6g8', 'e2e4'])
+        self.assertEqual(self.board.key, other.key)
+
+    def test_zobrist_polyglot(self):
+        # the keys of the Polyglot book format specification
+        self.assertEqual(self.board.key, 0x463b96181691fc9c)
+        for move, key in [
+            ('e2e4', 0x823c9b50fd114196),
+            ('d7d5', 0x0756b94461c50fb0),
+            ('e4e5', 0x662fafb965db29d4),
+            ('f7f5', 0x22a48b5a8e47ff78),
+            ('e1e2', 0x652a607ca3f242c1),
+            ('e8f7', 0x00fdd303c946bdd9),
+        ]:
+            self.board.make_move(move)
+            self.assertEqual(self.board.key, key)
+
+    def test_opening_book(self):
+        def entry(key, notation, weight):
+            old_pos = og_engine.Position(notation[:2])
+            new_pos = og_engine.Position(notation[2:4])
+            move = (new_pos.index | old_pos.index << 6
+                    | ' nbrq'.index(notation[4:] or ' ') << 12)
+            return og_engine.OpeningBook.entry.pack(key, move, weight, 0)
+
+        castling = og_engine.Board(fen='4k3/8/8/8/8/8/8/4K2R w K - 0 1')
+        promotion = og_engine.Board(fen='4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        start = self.board.key
+        entries = sorted([
+            (start, 'e2e4', 3), (start, 'd2d4', 1), (start, 'e2e5', 5),
+            (start, 'a2a3', 0), (start - 1, 'g1f3', 1),
+            (start + 1, 'c2c4', 1), (castling.key, 'e1h1', 1),
+            (promotion.key, 'b7b8n', 1),
+        ])
+        with tempfile.NamedTemporaryFile(suffix='.bin') as f:
+            f.write(b''.join(entry(*e) for e in entries))
+            f.flush()
+            book = og_engine.OpeningBook(f.name)
+            self.assertEqual(book.size, len(entries))
+
+            # the illegal e2e5 is left out, a2a3 never played
+            self.assertEqual(sorted((m.notation, w)
+                                    for m, w in book.moves(self.board)),
+                             [('a2a3', 0), ('d2d4', 1), ('e2e4', 3)])
+            self.assertEqual(book.moves(castling)[0][0].notation, 'e1g1')
+            self.assertEqual(book.moves(promotion)[0][0].notation, 'b7b8n')
+            self.assertIn(book.choose(self.board).notation, ['e2e4', 'd2d4'])
+
+            # played without searching, and searched out of the book
+            board = og_engine.Board(book=book)
+            self.assertIn(board.bestmove(depth=1).notation, ['e2e4', 'd2d4'])
+            self.assertEqual(board.tt.usage, 0)
+            self.assertIsNone(book.choose(board))
+            self.assertTrue(board.bestmove(depth=1))
+            board.sync_moves(['g1f3'])
+            self.assertIs(board.book, book)
+            book.close()
+
+        with tempfile.NamedTemporaryFile(suffix='.bin') as f:
+            self.assertEqual(og_engine.OpeningBook(f.name).moves(self.board),
+                             [])
+
+    def test_transposition_table(self):
+        tt = og_engine.TranspositionTable(1)
+        self.assertEqual(tt.size, 2 ** 20 // tt.entry_size)
+        key = self.board.key
+        self.assertIsNone(tt.probe(key))
+        tt.store(key, 3, 10, tt.exact, 'e2e4')
+        self.assertEqual(tt.probe(key)[1:5], (3, 10, tt.exact, 'e2e4'))
+        self.assertIsNone(tt.probe(key + tt.size))
+
+        # a shallower entry of another position does not replace it...
+        tt.store(key + tt.size, 1, 0, tt.upper)
+        self.assertEqual(tt.probe(key)[1], 3)
+        # ...unless the stored one is from an older search
+        tt.new_search()
+        tt.store(key + tt.size, 1, 0, tt.upper)
+        self.assertIsNone(tt.probe(key))
+        self.assertEqual(tt.probe(key + tt.size)[1], 1)
 
     def test_best_move(self):
         self.board.sync_moves(['g1h3', 'g7g5', 'h3g5'])
         self.board.bestmove()
 
+    def test_evaluate(self):
+        self.assertEqual(self.board.evaluate(), 0)
+        self.board.make_move('e2e4')
+        # black to move, white got its pawn to the centre
+        self.assertEqual(self.board.evaluate(), -40)
+
+        moves = ['d7d5', 'e4d5', 'e7e5', 'd5e6', 'f8e7', 'e6f7', 'e8f8',
+                 'f7g8q', 'h8g8', 'g1f3', 'b8c6', 'f1e2', 'd8d6', 'e1g1']
+        for move in moves:
+            self.board.make_move(move)
+            self.assertEqual(self.board.psqt, self.board.compute_psqt())
+        for move in moves:
+            self.board.undo_move()
+        self.assertEqual(self.board.evaluate(), -40)
+
+    def test_pawn_structure(self):
+        moves = ['e2e4', 'd7d5', 'e4d5', 'e7e5', 'd5e6', 'f8e7', 'e6f7',
+                 'e8f8', 'f7g8q', 'h8g8', 'h2h4', 'a7a6', 'h4h5', 'g7g5',
+                 'h5g6']
+        keys = [self.board.pawn_key]
+        for move in moves:
+            self.board.make_move(move)
+            self.assertEqual(self.board.pawn_key,
+                             self.board.compute_pawn_key())
+            keys.append(self.board.pawn_key)
+        # moves of other pieces keep the key
+        self.assertEqual(keys[6], keys[5])
+        for move in moves:
+            self.board.undo_move()
+            self.assertEqual(self.board.pawn_key, keys.pop(-2))
+
+        # boards evaluate the pawn structure by default
+        self.assertIsInstance(self.board.evaluator,
+                              og_engine.PawnStructureEvaluator)
+        evaluator = og_engine.PawnStructureEvaluator(
+            pawn_table=og_engine.PawnTable(64))
+        self.assertEqual(evaluator.evaluate(self.board), 0)
+        # doubled, isolated and passed white c pawns, an isolated passed
+        # one on a3 for black
+        board = og_engine.Board(
+            fen='4k3/8/8/8/2P5/p1P5/8/4K3 w - - 0 1', evaluator=evaluator)
+        self.assertEqual(evaluator.pawn_score(board),
+                         -10 - 2 * 15 + 10 + 20 - (-15 + 60))
+        self.assertEqual(board.evaluate(),
+                         board.psqt + evaluator.pawn_score(board))
+        table = evaluator.pawn_table
+        self.assertEqual((table.probes, table.hits), (4, 2))
+        self.assertEqual(table.hit_rate, 0.5)
+
+        search = og_engine.Search(board, depth=3)
+        search.run()
+        self.assertGreater(table.hit_rate, 0.8)
+
+        # added to another evaluator
+        mobility = og_engine.MobilityEvaluator()
+        evaluator = og_engine.PawnStructureEvaluator(mobility)
+        self.assertEqual(evaluator.evaluate(board),
+                         mobility.evaluate(board)
+                         + evaluator.pawn_score(board))
+
+    def test_evaluator(self):
+        board = og_engine.Board(evaluator=og_engine.MobilityEvaluator())
+        # both sides mirror each other
+        self.assertEqual(board.evaluate(), 0)
+        board.make_move('e2e4')
+        self.assertLess(board.evaluate(), -40)
+        board.sync_moves(['e2e3'])
+        self.assertIsInstance(board.evaluator, og_engine.MobilityEvaluator)
+        self.assertTrue(board.bestmove(depth=1))
+
+    @unittest.skipUnless(og_engine.np, 'needs NumPy')
+    def test_batch_evaluator(self):
+        boards = [og_engine.Board(fen=board.fen())
+                  for board in og_engine.random_walk(200)]
+        squares, white = og_engine.BatchEvaluator.encode(boards)
+        self.assertEqual(squares.shape, (200, 64))
+        for evaluator, mobility in [(og_engine.MaterialEvaluator(), False),
+                                    (og_engine.MobilityEvaluator(), True)]:
+            scores = og_engine.BatchEvaluator(mobility).evaluate(squares,
+                                                                 white)
+            self.assertEqual(list(scores),
+                             [evaluator.evaluate(board) for board in boards])
+
+        squares, _ = og_engine.BatchEvaluator.encode([self.board])
+        self.assertEqual(list(og_engine.BatchEvaluator(True)
+                              .evaluate(squares[0])), [0])
+
+        for result in og_engine.bench_eval(50):
+            self.assertEqual(result['mismatches'], 0, result)
+
+    def test_search_mate(self):
+        self.board.sync_moves(['f2f3', 'e7e5', 'g2g4'])
+        search = og_engine.Search(self.board, depth=3)
+        pv = search.run()
+        self.assertEqual(pv[0].notation, 'd8h4')
+        self.assertEqual(search.score, search.mate_score - 1)
+        # a found mate ends the iterative deepening
+        self.assertEqual(search.depth, 2)
+
+        self.assertEqual(self.board.bestmove(depth=2).notation, 'd8h4')
+        self.assertTrue(self.board.in_check())
+        self.assertEqual(self.board.legal_moves(), [])
+        self.assertIsNone(self.board.bestmove())
+
+    def test_see(self):
+        for fen, notation, gain in [
+            # undefended, defended by a pawn
+            ('4k3/8/8/3n4/4P3/8/8/4K3 w - - 0 1', 'e4d5', 320),
+            ('4k3/8/4p3/3n4/4P3/8/8/4K3 w - - 0 1', 'e4d5', 220),
+            ('4k3/2p5/3p4/8/8/8/8/3RK3 w - - 0 1', 'd1d6', -400),
+            # the second rook recaptures through the first one
+            ('4r1k1/8/8/4p3/8/8/4R3/4R1K1 w - - 0 1', 'e2e5', 100),
+            # a king does not recapture a defended piece
+            ('4k3/3p4/8/8/8/8/8/3RK3 w - - 0 1', 'd1d7', -400),
+            ('4k3/3p4/8/1B6/8/8/8/3RK3 w - - 0 1', 'd1d7', 100),
+            ('4k3/P7/8/8/8/8/8/4K3 w - - 0 1', 'a7a8q', 800),
+        ]:
+            board = og_engine.Board(fen=fen)
+            squares = board.squares[:]
+            self.assertEqual(board.see(og_engine.Move(board=board,
+                                                      notation=notation)),
+                             gain, fen)
+            self.assertEqual(board.squares, squares)
+
+    def test_quiescence(self):
+        # the queen does not take a pawn defended by a pawn at the horizon
+        board = og_engine.Board(fen='4k3/8/4p3/3p4/8/8/8/3QK3 w - - 0 1')
+        search = og_engine.Search(board, depth=1)
+        self.assertNotEqual(search.run()[0].notation, 'd1d5')
+        self.assertGreater(search.nodes, len(board.legal_moves()) + 1)
+
+    def test_search_stats(self):
+        self.board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6'])
+        infos = []
+        search = og_engine.Search(self.board, depth=3, on_info=infos.append)
+        search.run()
+        self.assertEqual(len(infos), 3)
+        self.assertTrue(infos[-1].startswith('info depth 3 score cp '))
+        self.assertIn(' pv %s' % ' '.join(m.notation for m in search.pv),
+                      infos[-1])
+
+        stats = search.stats()
+        self.assertEqual(stats['nodes'], search.nodes)
+        self.assertGreater(stats['qnodes'], 0)
+        self.assertLess(stats['qnodes'], stats['nodes'])
+        self.assertGreater(stats['tt_hits'], 0)
+        self.assertGreater(stats['cutoffs'], 0)
+        self.assertGreater(stats['nps'], 0)
+        self.assertGreater(stats['movegen_seconds'], 0)
+        self.assertGreater(stats['eval_seconds'], 0)
+        self.assertAlmostEqual(stats['movegen_seconds']
+                               + stats['eval_seconds']
+                               + stats['search_seconds'], stats['seconds'])
+
+        board = og_engine.Board()
+        board.sync_moves(['f2f3', 'e7e5', 'g2g4'])
+        search = og_engine.Search(board, depth=2)
+        search.run()
+        self.assertIn(' score mate 1 ', search.info())
+        board.make_move('d8h4')
+        search = og_engine.Search(board, depth=2)
+        search.run()
+        self.assertEqual(search.stats()['pv'], [])
+
+    def test_analysis_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analysis.db')
+            cache = og_engine.AnalysisCache(path, max_entries=3, min_depth=2)
+            board = og_engine.Board(cache=cache)
+            move = board.bestmove(depth=2)
+            # too shallow to be kept
+            board.bestmove(depth=1)
+            board.sync_moves([])
+            self.assertIs(board.cache, cache)
+            cache.close()
+
+            # the database is opened on first use
+            cache = og_engine.AnalysisCache(path, max_entries=3, min_depth=2)
+            self.assertIsNone(cache.db)
+            board = og_engine.Board(cache=cache)
+            search = og_engine.Search(board, depth=2)
+            self.assertEqual(board.bestmove(search=search), move)
+            self.assertEqual((search.nodes, search.depth), (0, 2))
+            board.undo_move()
+            # deeper than known, or restricted, is searched
+            search = og_engine.Search(board, depth=3)
+            board.bestmove(search=search)
+            self.assertGreater(search.nodes, 0)
+            board.undo_move()
+            search = og_engine.Search(board, depth=2, root_moves=['a2a3'])
+            self.assertEqual(search.run()[0].notation, 'a2a3')
+            self.assertEqual(cache.probe(board.key)[2], 3)
+            # time and node limits take as much time or as many nodes
+            search = og_engine.Search(board, movetime=1000)
+            self.assertFalse(search.satisfied_by(10, 10 ** 6, 0.5))
+            self.assertTrue(search.satisfied_by(2, 1000, 1))
+            search = og_engine.Search(board, nodes=5000)
+            self.assertFalse(search.satisfied_by(10, 4000, 10))
+            self.assertTrue(search.satisfied_by(2, 5000, 0))
+            self.assertFalse(og_engine.Search(board, infinite=True)
+                             .satisfied_by(10, 10 ** 6, 10))
+            board.make_move('h2h3')
+            cache.store(board.key, og_engine.pack_move(52, 36), 0, 2, 10 ** 6,
+                        10)
+            search = og_engine.Search(board, movetime=1000)
+            self.assertEqual([move.notation for move in search.run()],
+                             ['e7e5'])
+            self.assertEqual(search.nodes, 0)
+            search = og_engine.Search(board, nodes=2 * 10 ** 6, depth=3)
+            search.run()
+            self.assertGreater(search.nodes, 0)
+            board.undo_move()
+
+            for notation in ['e2e4', 'd2d4', 'c2c4', 'g1f3']:
+                board.make_move(notation)
+                board.bestmove(depth=2)
+                board.undo_move()
+                board.undo_move()
+            cache.flush()
+            self.assertEqual(cache.db.execute(
+                'SELECT COUNT(*) FROM analysis').fetchone()[0], 3)
+            self.assertEqual(cache.count, 3)
+            # the deepest result is kept
+            self.assertEqual(cache.probe(board.key)[2], 3)
+            cache.close()
+
+    def test_multipv(self):
+        self.board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6'])
+        single = og_engine.Search(self.board, depth=3)
+        single.run()
+        infos = []
+        search = og_engine.Search(self.board, depth=3, multipv=3,
+                                  on_info=infos.append)
+        search.run()
+        self.assertEqual(len(search.lines), 3)
+        scores = [score for score, _ in search.lines]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len({pv[0] for _, pv in search.lines}), 3)
+        self.assertEqual((search.score, search.pv), search.lines[0])
+        self.assertEqual(search.score, single.score)
+        self.assertEqual(len(infos), 9)
+        self.assertTrue(infos[-1].startswith('info depth 3 multipv 3 score '))
+        self.assertEqual(len(search.stats()['lines']), 3)
+
+        # as many lines as there are moves, among the moves asked for
+        board = og_engine.Board(fen='7k/8/8/8/8/8/8/K7 w - - 0 1')
+        search = og_engine.Search(board, depth=2, multipv=5)
+        search.run()
+        self.assertEqual(len(search.lines), 3)
+        search = og_engine.Search(board, depth=2, multipv=5,
+                                  root_moves=['a1a2', 'a1b1'])
+        search.run()
+        self.assertEqual(sorted(pv[0].notation for _, pv in search.lines),
+                         ['a1a2', 'a1b1'])
+
+        # a restricted search leaves no root entry for later searches
+        board = og_engine.Board()
+        og_engine.Search(board, depth=2, root_moves=['a2a3']).run()
+        self.assertIsNone(board.tt.probe(board.key))
+        og_engine.Search(board, depth=2).run()
+        self.assertNotEqual(board.tt.probe(board.key)[4],
+                            og_engine.pack_move(8, 16))
+
+    def test_search_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'search.prof')
+            self.assertTrue(og_engine.Search(self.board, depth=2,
+                                             profile=path).run())
+            with open(path) as f:
+                self.assertIn('negamax', f.read())
+
+    def test_search_limits(self):
+        search = og_engine.Search(self.board, nodes=100)
+        pv = search.run()
+        self.assertTrue(pv)
+        self.assertGreaterEqual(search.depth, 1)
+        self.assertLessEqual(search.nodes, 101 + 21)
+        self.assertEqual(self.board.history, [])
+
+        search = og_engine.Search(self.board, depth=3)
+        search.stop()
+        search.run()
+        self.assertEqual(search.depth, 1)
+
+        move = self.board.bestmove(depth=1)
+        self.assertEqual(self.board.history, [move])
+
+    def test_move_orderer(self):
+        self.board.sync_moves(['e2e4', 'd7d5', 'd1h5', 'g8f6'])
+        orderer = og_engine.MoveOrderer(8)
+        moves = self.board.legal_moves()
+        order = lambda tt_move=None, ply=0: [
+            m.notation for m in orderer.order(moves, tt_move, ply)]
+
+        # the least valuable attacker first, then the other captures
+        self.assertEqual(order()[0], 'e4d5')
+        self.assertEqual(set(order()[1:4]), {'h5d5', 'h5f7', 'h5h7'})
+        find = lambda notation: next(m for m in moves
+                                     if m.notation == notation)
+        self.assertEqual(order(find('a2a3').packed)[0], 'a2a3')
+        orderer.cutoff(find('b1c3'), 2, 3, 0)
+        orderer.cutoff(find('g1f3'), 3, 10, 1)
+        self.assertEqual(order(ply=2)[4:6], ['b1c3', 'g1f3'])
+        self.assertEqual(order(ply=3)[4:6], ['g1f3', 'b1c3'])
+        # no killers here, history decides
+        self.assertEqual(order(ply=1)[4:6], ['g1f3', 'b1c3'])
+        self.assertEqual((orderer.cutoffs, orderer.first_move_cutoffs), (2, 1))
+        self.assertEqual(orderer.first_move_cutoff_rate, 0.5)
+
+        search = og_engine.Search(self.board, depth=3)
+        search.run()
+        self.assertGreater(search.orderer.cutoffs, 0)
+        self.assertGreater(search.orderer.first_move_cutoff_rate, 0.5)
+
+    def test_allocate_time(self):
+        allocate = og_engine.Search.allocate_time
+        self.assertEqual(allocate(True), (None, None))
+        self.assertEqual(allocate(True, movetime=1030), (1, 1))
+        soft, hard = allocate(True, wtime=60030, btime=1000)
+        self.assertAlmostEqual(soft, 2)
+        self.assertAlmostEqual(hard, 6)
+        soft, hard = allocate(False, wtime=60030, btime=10030, binc=1000,
+                              movestogo=5)
+        self.assertAlmostEqual(soft, 2.75)
+        self.assertAlmostEqual(hard, 5)
+
+    def test_search_time(self):
+        self.board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6'])
+        search = og_engine.Search(self.board, movetime=100)
+        start = time.perf_counter()
+        pv = search.run()
+        # well short of the default depth's time, leaving room for a busy
+        # machine
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(pv)
+        self.assertEqual(len(self.board.history), 4)
+
+    def test_search_thread(self):
+        moves = []
+        searched = threading.Event()
+        thread = og_engine.SearchThread(
+            self.board, lambda move, ponder: moves.append(move),
+            infinite=True, on_info=lambda info: searched.set())
+        thread.start()
+        self.assertTrue(searched.wait(10))
+        self.assertEqual(moves, [])
+        thread.stop()
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(self.board.history, moves)
+
+    def test_ponder(self):
+        self.board.sync_moves(['e2e4', 'e7e5'])
+        search = og_engine.Search(self.board, ponder=True, movetime=50)
+        self.assertEqual(search.max_depth, search.max_ply)
+        with mock.patch('time.perf_counter', return_value=100):
+            search.start_time = 99
+            self.assertFalse(search.out_of_time())
+            self.assertFalse(search.out_of_soft_time())
+            search.ponderhit()
+            self.assertFalse(search.pondering)
+            self.assertAlmostEqual(search.hard_time, 1.02)
+            self.assertFalse(search.out_of_time())
+            search.start_time -= 0.1
+            self.assertTrue(search.out_of_time())
+
+        reported = []
+        searched = threading.Event()
+        thread = og_engine.SearchThread(
+            self.board, lambda move, ponder: reported.append((move, ponder)),
+            ponder=True, movetime=50, on_info=lambda info: searched.set())
+        thread.start()
+        self.assertTrue(searched.wait(10))
+        time.sleep(0.1)
+        # pondering goes on past the time limit
+        self.assertEqual(reported, [])
+        self.assertTrue(thread.waiting)
+        thread.ponderhit()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        # the search went on from where it was
+        self.assertGreater(thread.search.elapsed, 0.1)
+        move, ponder = reported[0]
+        self.assertEqual(self.board.history[-1], move)
+        self.assertEqual(thread.search.pv[:2], [move, ponder])
+
+    def test_sync_moves(self):
+        self.board.sync_moves(['e2e4', 'e7e5', 'g1f3'])
+        pieces = self.board.pieces
+        # a diverging history is undone only back to the common moves
+        self.board.sync_moves(['e2e4', 'e7e5', 'f1c4', 'g8f6'])
+        self.assertEqual(self.board.pieces, pieces)
+        self.assertEqual([m.notation for m in self.board.history],
+                         ['e2e4', 'e7e5', 'f1c4', 'g8f6'])
+        self.board.sync_moves(['e2e4'])
+        self.assertEqual(self.board.pieces, pieces)
+        self.assertEqual(len(self.board.history), 1)
+
+        fen = '4k3/8/8/8/8/8/4P3/4K3 w - - 0 40'
+        self.board.sync_moves(['e2e4', 'e8d7'], fen)
+        self.assertEqual(self.board.fen(), '8/3k4/8/8/4P3/8/8/4K3 w - - 1 41')
+        self.board.sync_moves(['e2e4', 'e8e7'], fen)
+        self.assertEqual(self.board.fen(), '8/4k3/8/8/4P3/8/8/4K3 w - - 1 41')
+        self.board.sync_moves([])
+        self.assertEqual(self.board.fen(), og_engine.start_fen)
+
+    def test_parse_position(self):
+        self.assertEqual(og_engine.parse_position('position startpos'),
+                         (None, []))
+        self.assertEqual(
+            og_engine.parse_position('position startpos moves e2e4 e7e5'),
+            (None, ['e2e4', 'e7e5']))
+        self.assertEqual(
+            og_engine.parse_position(
+                'position fen 8/8/8/8/8/8/8/K6k w - - 0 1 moves a1a2'),
+            ('8/8/8/8/8/8/8/K6k w - - 0 1', ['a1a2']))
+
+    def test_parse_go(self):
+        self.assertEqual(og_engine.parse_go('go blablabla'), {})
+        self.assertEqual(
+            og_engine.parse_go('go wtime 1000 btime 2000 winc 10 binc 20 '
+                               'movestogo 5'),
+            {'wtime': 1000, 'btime': 2000, 'winc': 10, 'binc': 20,
+             'movestogo': 5})
+        self.assertEqual(og_engine.parse_go('go infinite'),
+                         {'infinite': True})
+        self.assertEqual(og_engine.parse_go('go ponder wtime 1000'),
+                         {'ponder': True, 'wtime': 1000})
+        self.assertEqual(
+            og_engine.parse_go('go searchmoves e2e4 a7a8q depth 2'),
+            {'root_moves': ['e2e4', 'a7a8q'], 'depth': 2})
+        self.assertEqual(og_engine.parse_go('go depth 3 nodes 100'),
+                         {'depth': 3, 'nodes': 100})
+
     def test_pgn_match(self):
         m = lambda notation: og_engine.Move.pgn_re.match(notation)
         clean = lambda m: {k:v for k,v in m.items() if v}
@@ -114,10 +908,246 @@ class EngineTestCase(unittest.TestCase):
         self.assertFalse(self.board['e5'])
 
 
+class PGNTestCase(unittest.TestCase):
+
+    pgn = (
+        '[Event "Test"]\n'
+        '[White "A \\"quoted\\" name"]\n'
+        '[Result "1-0"]\n'
+        '\n'
+        '1. e4 e5 2. Nf3 {a comment\n'
+        '[spanning lines]} Nc6 3. Bb5 a6 (3... Nf6 4. O-O (4. d3) Nxe4)\n'
+        '4. Ba4 Nf6 5. O-O $1 Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O 9. h3 Nb8\n'
+        '10. d4 Nbd7 1-0\n'
+        '\n'
+        '[Event "Promotion"]\n'
+        '[FEN "8/P7/8/8/8/8/8/k6K w - - 0 1"]\n'
+        '\n'
+        '1. a8=Q+ Kb2 ; line comment\n'
+        '2. Qb7+!? *\n'
+        '% escaped line\n'
+        '[Event "Illegal"]\n'
+        '\n'
+        '1. e4 e5 2. Ke3 *\n'
+    )
+
+    def test_read_pgn(self):
+        games = list(og_engine.read_pgn(io.StringIO(self.pgn)))
+        self.assertEqual(len(games), 3)
+        self.assertEqual(games[0].headers['White'], 'A "quoted" name')
+        self.assertEqual(games[0].result, '1-0')
+        self.assertEqual(len(games[0].moves), 20)
+        self.assertEqual(games[0].moves[-2:], ['d4', 'Nbd7'])
+        self.assertEqual(games[0].uci_moves()[8], 'e1g1')
+        self.assertEqual(games[1].moves, ['a8=Q+', 'Kb2', 'Qb7+'])
+        self.assertEqual(games[1].uci_moves(), ['a7a8q', 'a1b2', 'a8b7'])
+        self.assertRaises(ValueError, games[2].uci_moves)
+
+    def test_read_pgn_sources(self):
+        texts = list(og_engine.read_pgn_texts(self.pgn.encode('utf8')))
+        self.assertEqual(len(texts), 3)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'games.pgn')
+            with open(path, 'w') as f:
+                f.write(self.pgn)
+            self.assertEqual(list(og_engine.read_pgn_texts(path)), texts)
+
+            games = list(og_engine.read_pgn_parallel(path, processes=2))
+        self.assertEqual([moves and len(moves) for _, moves, _ in games],
+                         [20, 3, None])
+        self.assertEqual([result for _, _, result in games],
+                         ['1-0', '*', '*'])
+
+
+class EPDTestCase(unittest.TestCase):
+
+    epd = (
+        '# a suite\n'
+        '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - bm Rd8#; id "back rank";\n'
+        '\n'
+        'rnb1kbnr/pppp1ppp/8/4p3/4P2q/5N2/PPPP1PPP/RNBQKB1R w KQkq - '
+        'bm Nxh4 Nd4; c0 "two; moves";\n'
+        'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - '
+        'am Ng5; id "no Ng5";\n'
+    )
+
+    def test_read_epd(self):
+        positions = list(og_engine.read_epd(io.StringIO(self.epd)))
+        self.assertEqual(len(positions), 3)
+        self.assertEqual(positions[0].fen, '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - -')
+        self.assertEqual(positions[0].id, 'back rank')
+        self.assertEqual(positions[0].moves('bm'), ['d1d8'])
+        self.assertEqual(positions[1].operations,
+                         {'bm': ['Nxh4', 'Nd4'], 'c0': ['two; moves']})
+        self.assertEqual(positions[1].id, None)
+        self.assertEqual(positions[1].moves('bm'), ['f3h4', 'f3d4'])
+        self.assertEqual(positions[2].moves('am'), ['f3g5'])
+
+    def test_run_epd(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'suite.epd')
+            with open(path, 'w') as f:
+                f.write(self.epd)
+            results = list(og_engine.run_epd(path, processes=2, hash_mb=1,
+                                             depth=2))
+        self.assertEqual([result['move'] for result in results][:2],
+                         ['d1d8', 'f3h4'])
+        self.assertTrue(all(result['solved'] for result in results))
+        self.assertEqual(results[0]['depth'], 2)
+        self.assertLessEqual(results[0]['time_to_solution'],
+                             results[0]['seconds'])
+
+        summary = og_engine.epd_summary(results + [dict(
+            results[0], solved=False, time_to_solution=None)])
+        self.assertEqual((summary['positions'], summary['solved']), (4, 3))
+        self.assertEqual(summary['solve_rate'], 0.75)
+        self.assertEqual(summary['nodes'],
+                         sum(r['nodes'] for r in results) + results[0]['nodes'])
+        self.assertGreater(summary['nps'], 0)
+
+
+class ParallelSearchTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        og_engine.close_worker_pools()
+
+    def test_parallel_search(self):
+        board = og_engine.Board()
+        board.sync_moves(['f2f3', 'e7e5', 'g2g4'])
+        search = og_engine.new_search(board, threads=2, depth=3)
+        self.assertIsInstance(search, og_engine.ParallelSearch)
+        pv = search.run()
+        self.assertEqual(pv[0].notation, 'd8h4')
+        self.assertEqual(search.score, search.mate_score - 1)
+
+        board = og_engine.Board()
+        board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6'])
+        serial = og_engine.Search(board, depth=3)
+        serial.run()
+        parallel = og_engine.ParallelSearch(board, threads=2, depth=3)
+        parallel.run()
+        self.assertEqual(parallel.depth, 3)
+        self.assertEqual(parallel.score, serial.score)
+        self.assertEqual(len(board.history), 4)
+
+        move = board.bestmove(threads=2, depth=1)
+        self.assertEqual(board.history[-1], move)
+        board.undo_move()
+
+        # not from what the deeper searches left in the tables
+        board.tt.clear()
+        og_engine.close_worker_pools()
+        serial = og_engine.Search(board, depth=2, multipv=3)
+        serial.run()
+        parallel = og_engine.ParallelSearch(board, threads=2, depth=2,
+                                            multipv=3)
+        parallel.run()
+        self.assertEqual(len({pv[0] for _, pv in parallel.lines}), 3)
+        scores = [score for score, _ in parallel.lines]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(parallel.score, serial.score)
+
+    def test_parallel_evaluator(self):
+        # the workers evaluate as the board does
+        for evaluator in [og_engine.MobilityEvaluator(),
+                          og_engine.PawnStructureEvaluator(
+                              og_engine.MobilityEvaluator())]:
+            board = og_engine.Board(evaluator=evaluator)
+            board.sync_moves(['e2e4', 'e7e5', 'g1f3', 'b8c6'])
+            serial = og_engine.Search(board, depth=2)
+            serial.run()
+            parallel = og_engine.ParallelSearch(board, threads=2, depth=2)
+            parallel.run()
+            self.assertEqual(parallel.score, serial.score)
+
+    def test_bench_threads(self):
+        results = og_engine.bench_threads(1, [1, 2],
+                                          og_engine.perft_positions[:2])
+        self.assertEqual([r['threads'] for r in results], [1, 2])
+        self.assertEqual(results[0]['speedup'], 1)
+        self.assertTrue(all(r['nodes'] for r in results))
+
+
+class MatchTestCase(unittest.TestCase):
+
+    # white mates in one
+    mate_fen = '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1'
+
+    def test_statistics(self):
+        elo, margin = og_engine.elo_difference(600, 1000, 400)
+        self.assertAlmostEqual(elo, 34.9, places=1)
+        self.assertAlmostEqual(margin, 10.8, places=1)
+        self.assertAlmostEqual(og_engine.elo_difference(10, 0, 10)[0], 0)
+
+        llr, lower, upper, decision = og_engine.sprt(0, 0, 0)
+        self.assertEqual((llr, decision), (0, None))
+        self.assertAlmostEqual(lower, -2.944, places=3)
+        self.assertAlmostEqual(upper, 2.944, places=3)
+        self.assertEqual(og_engine.sprt(60, 100, 40)[3], None)
+        self.assertEqual(og_engine.sprt(600, 1000, 400)[3], 'H1')
+        self.assertEqual(og_engine.sprt(400, 1000, 600)[3], 'H0')
+        # not without wins, draws and losses
+        self.assertEqual(og_engine.sprt(100, 0, 1)[3], None)
+
+    def test_game_over(self):
+        board = og_engine.Board(fen=self.mate_fen)
+        seen = {board.key: 1}
+        self.assertEqual(og_engine.game_over(board, seen, 10), (None, None))
+        self.assertEqual(og_engine.game_over(board, seen, 0),
+                         ('1/2-1/2', 'adjudicated'))
+        board.make_move('d1d8')
+        seen[board.key] = 1
+        self.assertEqual(og_engine.game_over(board, seen, 10), ('1-0', 'mate'))
+
+        board = og_engine.Board(fen='7k/8/6Q1/8/8/8/8/K7 b - - 0 1')
+        self.assertEqual(og_engine.game_over(board, {board.key: 1}, 10),
+                         ('1/2-1/2', 'stalemate'))
+        board = og_engine.Board(fen='7k/8/8/8/8/8/8/K7 w - - 0 1')
+        self.assertEqual(og_engine.game_over(board, {board.key: 3}, 10),
+                         ('1/2-1/2', 'repetition'))
+        self.assertEqual(og_engine.game_over(board, {board.key: 1}, 10),
+                         ('1/2-1/2', 'insufficient material'))
+
+    def test_play_game(self):
+        game = og_engine.play_game({'name': 'a'}, {'name': 'b'},
+                                   self.mate_fen, {'depth': 2})
+        self.assertEqual((game['result'], game['reason']), ('1-0', 'mate'))
+        self.assertEqual(game['moves'], ['d1d8'])
+        self.assertGreater(game['nodes']['a'], 0)
+        self.assertEqual(game['nodes']['b'], 0)
+
+    def test_run_match(self):
+        first = {'name': 'material'}
+        second = {'name': 'mobility', 'options': {'Evaluator': 'Mobility'}}
+        results = list(og_engine.run_match(
+            first, second, [self.mate_fen], 4, {'depth': 2}, processes=2,
+            elo1=400))
+        games = [game for game, _ in results]
+        stats = results[-1][1]
+        self.assertEqual(len(games), 4)
+        self.assertEqual(sorted(game['white'] for game in games),
+                         ['material', 'material', 'mobility', 'mobility'])
+        self.assertEqual((stats['wins'], stats['losses'], stats['draws']),
+                         (2, 2, 0))
+        self.assertAlmostEqual(stats['elo'], 0)
+        self.assertEqual(stats['sprt'], None)
+        self.assertGreater(stats['games_per_hour'], 0)
+        self.assertGreater(stats['nps']['mobility'], 0)
+
+        # a decided SPRT stops the match
+        with mock.patch('og_engine.sprt', return_value=(3, -3, 3, 'H1')):
+            results = list(og_engine.run_match(
+                first, second, [self.mate_fen], 8, {'depth': 2},
+                processes=2))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[-1][1]['sprt'], 'H1')
+
+
 class EngineIOTestCase(unittest.TestCase):
 
     def setUp(self):
-        self.proc = Popen(['./og_engine.py'], stdin=PIPE, stdout=PIPE)
+        self.proc = Popen(['./og_engine.py', '--log', ''], stdin=PIPE,
+                          stdout=PIPE)
 
     def tearDown(self):
         self.write('quit')
@@ -130,6 +1160,13 @@ class EngineIOTestCase(unittest.TestCase):
     def read(self):
         return self.proc.stdout.readline().decode('utf8').strip()
 
+    def read_reply(self):
+        """The next line which is not an info line of a running search."""
+        line = self.read()
+        while line.startswith('info '):
+            line = self.read()
+        return line
+
     def write(self, msg):
         self.proc.stdin.write(('%s\n' % msg).encode('utf8'))
         self.proc.stdin.flush()
@@ -138,21 +1175,106 @@ class EngineIOTestCase(unittest.TestCase):
         self.write('uci')
         self.assertRead('id name og-engine')
         self.assertRead('id author og')
+        self.assertRead('option name Hash type spin default 16 min 1 max 4096')
+        self.assertTrue(self.read().startswith(
+            'option name Threads type spin default 1 min 1 max '))
+        self.assertRead('option name MultiPV type spin default 1 min 1 max 256')
+        self.assertRead('option name Evaluator type combo default Material '
+                        'var Material var Mobility')
+        self.assertRead('option name PawnStructure type check default true')
+        self.assertRead('option name Ponder type check default false')
+        self.assertRead('option name OwnBook type check default false')
+        self.assertRead('option name BookFile type string default <empty>')
+        self.assertRead('option name ProfileFile type string default <empty>')
+        self.assertRead('option name AnalysisCache type string default <empty>')
         self.assertRead('uciok')
         self.write('isready')
         self.assertRead('readyok')
 
+    def test_perft(self):
+        self.write('position startpos moves e2e4')
+        self.write('go perft 1')
+        moves = [self.read() for _ in range(20)]
+        self.assertIn('e7e5: 1', moves)
+        self.assertTrue(self.read().startswith('info nodes 20 '))
+        self.assertRead('')
+        self.assertRead('Nodes searched: 20')
+
+    def test_position_fen(self):
+        self.write('position fen 6k1/8/8/6K1/8/8/8/1Q6 w - - 0 1 '
+                   'moves g5g6 g8h8')
+        self.write('go depth 2')
+        self.assertEqual(self.read_reply(), 'bestmove b1b8')
+
+    def test_info(self):
+        self.write('position startpos')
+        self.write('go depth 2')
+        self.assertTrue(re.match(r'info depth 1 score cp -?\d+ nodes \d+ '
+                                 r'nps \d+ time \d+ hashfull \d+ pv \w{4}$',
+                                 self.read()))
+        self.assertTrue(self.read().startswith('info depth 2 '))
+        self.assertTrue(self.read().startswith('bestmove '))
+
+    def test_stop(self):
+        self.write('position startpos')
+        self.write('go infinite')
+        self.write('isready')
+        self.assertEqual(self.read_reply(), 'readyok')
+        self.write('stop')
+        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]',
+                                 self.read_reply()))
+
+    def test_ponder(self):
+        self.write('position startpos')
+        self.write('go depth 3')
+        m = re.match('bestmove (\\w{4}) ponder (\\w{4})$', self.read_reply())
+        self.assertTrue(m)
+        self.write('position startpos moves %s %s' % m.groups())
+        self.write('go ponder movetime 100')
+        self.write('isready')
+        self.assertEqual(self.read_reply(), 'readyok')
+        self.write('ponderhit')
+        self.assertTrue(self.read_reply().startswith('bestmove '))
+
+        # the opponent played another move
+        self.write('position startpos moves %s a7a6' % m.group(1))
+        self.write('go ponder movetime 100')
+        self.write('stop')
+        self.assertTrue(self.read_reply().startswith('bestmove '))
+
+    def test_threads(self):
+        self.write('setoption name Threads value 2')
+        self.write('position startpos')
+        self.write('go movetime 500')
+        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]',
+                                 self.read_reply()))
+        self.write('go infinite')
+        self.write('stop')
+        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]',
+                                 self.read_reply()))
+
+    def test_multipv(self):
+        self.write('setoption name MultiPV value 2')
+        self.write('position startpos')
+        self.write('go depth 1 searchmoves a2a3 b2b3 c2c3')
+        self.assertTrue(re.match(r'info depth 1 multipv 1 score cp -?\d+ .* '
+                                 r'pv [abc]2[abc]3$', self.read()))
+        self.assertTrue(self.read().startswith('info depth 1 multipv 2 '))
+        self.assertTrue(re.match('bestmove [abc]2[abc]3', self.read()))
+
     def test_start_as_white(self):
         self.write('ucinewgame')
         self.write('position startpos')
         self.write('go blablabla')
-        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]', self.read()))
+        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]',
+                                 self.read_reply()))
 
     def test_start_as_black(self):
         self.write('ucinewgame')
         self.write('position startpos moves d2d3')
         self.write('go blablabla')
-        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]', self.read()))
+        self.assertTrue(re.match('bestmove [a-h][1-8][a-h][1-8]',
+                                 self.read_reply()))
 
 
 if __name__ == '__main__':